@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+"""Benchmark the clock on the simulator backend and write the results as JSON.
+
+Measures per-screen frame composition time, bytes pushed to the display
+and CPU time per simulated second while idle and while buttons are
+pressed, button-press-to-frame latency and the time from the alarm
+deadline to the first audible sound under the simulated stream failures.
+
+RESULTS_VERSION changes whenever a workload does; only compare results
+with the same version.
+"""
+import argparse
+import contextlib
+import importlib.util
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import threading
+from datetime import datetime, timedelta
+from time import perf_counter, process_time, sleep
+
+import simulator
+
+CLOCK_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "rpi-alarmclock.py")
+RESULTS_VERSION = 2
+
+
+def load_clock():
+    """Import rpi-alarmclock.py (not importable by name because of the dash)."""
+    spec = importlib.util.spec_from_file_location("alarmclock", CLOCK_SCRIPT)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def summarize(samples, scale=1000):
+    """Mean, median, 95th percentile and max of samples, in ms by default."""
+    ordered = sorted(samples)
+    p95 = ordered[min(len(ordered) - 1, int(round(0.95 * (len(ordered) - 1))))]
+    return {
+        "samples": len(ordered),
+        "mean": round(statistics.mean(ordered) * scale, 3),
+        "p50": round(statistics.median(ordered) * scale, 3),
+        "p95": round(p95 * scale, 3),
+        "max": round(ordered[-1] * scale, 3),
+    }
+
+
+def make_home():
+    """A simulator home with one local track for the alarm fallback."""
+    home = tempfile.mkdtemp(prefix="alarmclock-bench-")
+    os.makedirs(os.path.join(home, "Music"))
+    open(os.path.join(home, "Music", "track.mp3"), "wb").close()
+    return home
+
+
+def start_clock(clock, **options):
+    backend = simulator.SimBackend(clock, home=make_home(), **options)
+    clock.use_backend(backend)
+    menu = clock.Menu(backend)
+    menu.refresh()
+    return backend, menu
+
+
+def run_app(clock, menu, duration):
+    """Run ClockApp for `duration` simulated seconds."""
+    loop = clock.CLOCK.new_event_loop()
+    try:
+        loop.run_until_complete(clock.run_for(clock.ClockApp(menu).run(), duration))
+        # Drop the fake player's pending events before their loop goes away.
+        if menu.audio.player is not None:
+            menu.audio.player.stop()
+    finally:
+        loop.close()
+    menu.display.wait_idle(1)
+
+
+def bench_composition(clock, repeat):
+    """Time composing each screen's frame (static layer lookup plus dynamic text)."""
+    _, menu = start_clock(clock)
+    frame = menu.display.back
+    results = {}
+    for screen in menu.top_menu:
+        menu.layers.layers.clear()
+        clock.TEXT_BLOCKS.blocks.clear()
+        started = perf_counter()
+        frame.begin(menu.layers.get(screen))
+        screen.draw_dynamic(frame)
+        cold = perf_counter() - started
+
+        samples = []
+        for _ in range(repeat):
+            started = perf_counter()
+            frame.begin(menu.layers.get(screen))
+            screen.draw_dynamic(frame)
+            samples.append(perf_counter() - started)
+        result = summarize(samples)
+        result["cold"] = round(cold * 1000, 3)
+        results[type(screen).__name__] = result
+    return results
+
+
+def bench_load(clock, duration, speed):
+    """Display bytes and process CPU time per simulated second, with no input and with a press every second."""
+    bytes_sent = {}
+    cpu = {}
+    presses = ["Y", "X", "B", "B"]
+    for name, script in (
+        ("idle", []),
+        ("active", [(1 + i, presses[i % len(presses)]) for i in range(int(duration) - 1)]),
+    ):
+        backend, menu = start_clock(clock, speed=speed, script=script)
+        sent_before = backend.display.bytes_sent
+        cpu_before = process_time()
+        run_app(clock, menu, duration)
+        cpu[name] = round((process_time() - cpu_before) * 1000 / duration, 3)
+        bytes_sent[name] = round((backend.display.bytes_sent - sent_before) / duration, 1)
+    return bytes_sent, cpu
+
+
+def bench_input_latency(clock, presses):
+    """Real time from a button going down to the frame it causes reaching the display.
+
+    Includes the BUTTON_DEBOUNCE settling time.
+    """
+    backend, menu = start_clock(clock)
+    presented = threading.Event()
+    presented_at = [None]
+    present = menu.renderer.present
+
+    def on_present():
+        present()
+        presented_at[0] = perf_counter()
+        presented.set()
+
+    menu.renderer.present = on_present
+    samples = []
+
+    def press_buttons():
+        sleep(0.2)
+        for i in range(presses):
+            presented.clear()
+            started = perf_counter()
+            backend.press("Y" if i % 2 == 0 else "X", hold=0.1)
+            if presented.wait(1):
+                samples.append(presented_at[0] - started)
+            sleep(0.05)
+
+    presser = threading.Thread(target=press_buttons, daemon=True)
+    presser.start()
+    run_app(clock, menu, 0.5 + presses * 0.25)
+    presser.join()
+    return summarize(samples) if samples else None
+
+
+def bench_alarm(clock, failure, preroll, speed):
+    """Simulated seconds from the alarm deadline to the first audible sound."""
+    clock.ALARM_PREROLL = preroll
+    lead = preroll + 10
+    start = datetime(2026, 1, 5, 7, 0) - timedelta(seconds=lead)
+    backend, menu = start_clock(clock, speed=speed, start=start, alarm="07:00", stream_failure=failure)
+    run_app(clock, menu, lead + clock.ALARM_CONNECT_TIMEOUT + 15)
+
+    sim_clock = backend.clock
+    deadline = sim_clock.real_base + datetime(2026, 1, 5, 7, 0).timestamp() - sim_clock.wall_base
+    player = backend.vlc.players[0]
+    if not player.audible:
+        return {"latency": None, "source": None}
+    heard_at, mrl = player.audible[0]
+    return {
+        "latency": round(heard_at - deadline, 2),
+        "source": "stream" if mrl == clock.STREAM_URL else "local",
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--output", help="write the JSON here instead of stdout")
+    parser.add_argument("--quick", action="store_true", help="fewer samples, for a smoke run")
+    args = parser.parse_args()
+
+    clock = load_clock()
+    repeat = 20 if args.quick else 200
+    failures = [None] + list(simulator.SIM_STREAM_FAILURES)
+    preroll = clock.ALARM_PREROLL
+
+    # The clock prints playback progress; keep stdout for the JSON.
+    with contextlib.redirect_stdout(sys.stderr):
+        bytes_sent, cpu = bench_load(clock, 30 if args.quick else 120, 30)
+        results = {
+            "version": RESULTS_VERSION,
+            "generated_at": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "composition_ms": bench_composition(clock, repeat),
+            "display_bytes_per_second": bytes_sent,
+            "cpu_ms_per_second": cpu,
+            "button_to_frame_ms": bench_input_latency(clock, 10 if args.quick else 50),
+            "alarm_to_audio_s": {
+                "preroll": {f or "ok": bench_alarm(clock, f, preroll, 20) for f in failures},
+                "no_preroll": {f or "ok": bench_alarm(clock, f, 0, 20) for f in failures},
+            },
+        }
+        clock.ALARM_PREROLL = preroll
+
+    text = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as output:
+            output.write(text + "\n")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,41 +1,471 @@
 #!/usr/bin/env python3
+import argparse
+import asyncio
 import os
 import csv
+import json
 import random
 import re
-from datetime import datetime
-from time import sleep
+from datetime import date, datetime, timedelta
+from time import monotonic, perf_counter, sleep, time
+from urllib.parse import urljoin, urlparse
+from urllib.request import urlopen
 import subprocess
+import sys
 import threading
+import uuid
+from bisect import bisect_left, bisect_right, insort
+from collections import OrderedDict, deque
 
-import RPi.GPIO as GPIO
-import st7789
-import vlc
-import requests
+import numpy as np
 from PIL import Image, ImageDraw, ImageFont
 
+try:
+    import alsaaudio
+except ImportError:
+    alsaaudio = None
+
 # Constants
 BUTTONS = [5, 6, 16, 24]
 LABELS = ['A', 'B', 'X', 'Y']
+BUTTON_DEBOUNCE = 0.02  # seconds a button level must be stable after an edge
+BUTTON_LONG_PRESS = 0.8  # seconds held before a press counts as a long press
+BUTTON_REPEAT_DELAY = 0.5  # seconds held before a repeating button starts repeating
+BUTTON_REPEAT_INTERVAL = 0.25  # first repeat interval; each repeat shortens it ...
+BUTTON_REPEAT_ACCELERATION = 0.85  # ... by this factor ...
+BUTTON_REPEAT_MIN_INTERVAL = 0.05  # ... down to this
 DAY_TO_STRING = ["poniedzialek", "wtorek", "sroda", "czwartek", "piatek", "sobota", "niedziela"]
+DIRTY_BAND_HEIGHT = 16  # rows per band when splitting the damaged area into windows
+FULL_FRAME_RATIO = 0.6  # above this share of dirty pixels a full frame is cheaper
+DISPLAY_RETRY_DELAY = 1  # seconds before a frame whose transfer failed is sent again
+FONT_FACE = "arial.ttf"
+TEXT_SPRITE_CACHE_SIZE = 256
+TEXT_BLOCK_CACHE_SIZE = 128  # text sprites pre-blended onto a layer, in RGB565
+STREAM_URL = 'https://ice.actve.net/fm-evropa2-128'  # the station used when there is no stations file
+STATIONS_PATH = "/home/pi/stations.json"
+STREAM_RESOLVE_TIMEOUT = 5  # seconds to fetch a .pls/.m3u playlist
+STREAM_RESOLVE_TTL = 6 * 3600  # seconds a resolved playlist stays valid
+RADIO_WARM_ADJACENT = True  # keep the previous and next stations buffering, muted, while the radio plays
+RADIO_REBUFFER_LIMIT = 2  # rebuffers within RADIO_REBUFFER_WINDOW that switch to the low bitrate variant
+RADIO_REBUFFER_WINDOW = 60
+STREAM_CACHE_DIR = "/home/pi/.alarmclock-cache"  # rolling recording of the alarm station
+STREAM_CACHE_SEGMENTS = 12  # files in the ring; one more is being written
+STREAM_CACHE_SEGMENT_SIZE = 2 * 1024 * 1024  # bytes per file, about 2 minutes at 128 kbit/s
+STREAM_CACHE_WRITE_SIZE = 256 * 1024  # bytes buffered per write to the SD card
+STREAM_CACHE_WINDOW = 30 * 60  # seconds before an alarm to record
+STREAM_CACHE_MAX_AGE = 6 * 3600  # the radio records while the cache is older than this
+STREAM_CACHE_TIMEOUT = 10  # seconds a stream read may block
+STREAM_CACHE_RETRY = 30  # seconds between attempts after a stream error
+STREAM_CACHE_TYPES = {"audio/aac": ".aac", "audio/aacp": ".aac", "audio/ogg": ".ogg"}  # else .mp3
+MEDIA_CACHE_SIZE = 8  # parsed vlc.Media objects kept for reuse
+MUSIC_DIR = "/home/pi/Music"
+MUSIC_EXTENSIONS = (".mp3", ".ogg", ".oga", ".opus", ".flac", ".wav", ".m4a", ".aac", ".wma")
+MUSIC_RESCAN_INTERVAL = 600  # seconds between directory mtime checks
+MIXER_CONTROL = "Master"
+MIXER_APPLY_INTERVAL = 0.1  # seconds; faster presses are coalesced into one level
+PRIORITY_RADIO = 1
+PRIORITY_ALARM = 2
+SCHEDULE_PATH = "/home/pi/alarmclock.json"
+LEGACY_SCHEDULE_PATH = "/home/pi/alarmclock.csv"  # read (and converted) when SCHEDULE_PATH is missing
+SCHEDULE_VERSION = 1
+WEEKDAY_ALARM_IDS = {f"day{day}": day for day in range(7)}  # the alarms behind the weekday edit screen
+SCHEDULE_HORIZON_DAYS = 14  # days of fire times kept in the sorted index
+SCHEDULE_LOOKAHEAD_DAYS = 400  # furthest a next-alarm query looks
+HOLIDAY_DATE = re.compile(r"(\d{4})-?(\d{2})-?(\d{2})")
+SCHEDULE_WRITE_DELAY = 3  # seconds without edits before the schedule is saved
+SCHEDULE_WATCH_INTERVAL = 30  # seconds between checks of the schedule file's mtime for hand edits
+DIM_TIMEOUT = 30  # seconds without input before the backlight turns off
+BACKLIGHT_LEVEL = 60  # PWM duty cycle (%) while lit
+BACKLIGHT_ALARM_LEVEL = 100  # while the alarm rings
+BACKLIGHT_FADE = 0  # seconds to fade between levels (0 switches at once)
+BACKLIGHT_FADE_STEPS = 10
+REFRESH_INTERACTIVE_FPS = 30  # frame rate cap for REFRESH_INTERACTIVE_WINDOW seconds after input
+REFRESH_INTERACTIVE_WINDOW = 5
+REFRESH_IDLE_INTERVAL = 1  # seconds between frames otherwise (minute updates, status changes)
+CONNECTIVITY_HOST = "192.168.0.1"  # probed with a plain TCP connect
+CONNECTIVITY_PORT = 80
+CONNECTIVITY_INTERFACE = "wlan0"  # link state read from sysfs before probing
+CONNECTIVITY_TIMEOUT = 1.5  # seconds per probe
+CONNECTIVITY_MIN_INTERVAL = 2  # seconds between probes right after a change
+CONNECTIVITY_MAX_INTERVAL = 60  # probe interval backs off to this while stable
+CONNECTIVITY_POOR_LATENCY = 0.3  # seconds; slower probes prefer low bitrate streams
+ALARM_DURATION = 20 * 60  # seconds an alarm rings before stopping by itself
+ALARM_CONNECT_TIMEOUT = 20  # seconds for the stream to start before falling back
+ALARM_STALL_TIMEOUT = 15  # seconds a playing stream may rebuffer before falling back
+ALARM_RETRY_DELAY = 5  # seconds before retrying the stream when no fallback exists
+ALARM_PREROLL = 45  # seconds before the alarm to open and buffer the stream muted (0 disables)
+ALARM_GRACE = 30  # seconds an alarm may still fire late, e.g. after a clock step
+CLOCK_STEP_CHECK_INTERVAL = 60  # seconds between wall clock step checks while waiting
+CLOCK_STEP_TOLERANCE = 2  # seconds of wall/monotonic drift treated as a clock step
+BACKEND_ENV = "ALARMCLOCK_BACKEND"  # "pi" (default) or "sim"
+BACKGROUND_PATH = "/home/pi/cat.jpg"
+METRICS_SOCKET = "/home/pi/alarmclock-metrics.sock"  # read with e.g. `socat - UNIX-CONNECT:<path>`
+METRICS_TEXTFILE = None  # e.g. "/var/lib/node_exporter/textfile_collector/alarmclock.prom"
+METRICS_TEXTFILE_INTERVAL = 60  # seconds between textfile writes
+API_SOCKET = "/home/pi/alarmclock-api.sock"  # control API, e.g. `curl --unix-socket <path> http://clock/status`
+API_HOST = "127.0.0.1"
+API_PORT = None  # also serve the API on API_HOST:API_PORT; it has no authentication
+API_REQUEST_TIMEOUT = 10  # seconds to receive a request
+API_MAX_BODY = 16 * 1024
+API_EVENT_DELAY = 0.2  # seconds changes are collected into one event
+API_CLIENT_QUEUE = 16  # events buffered per slow client before the oldest are dropped
+API_KEEPALIVE = 30  # seconds between comments on an idle event stream
+
+
+class Clock:
+    """Wall and monotonic time as seen by the clock; the simulator scales it."""
+
+    speed = 1
+
+    def monotonic(self):
+        return monotonic()
+
+    def time(self):
+        return time()
+
+    def now(self):
+        return datetime.now()
+
+    def sleep(self, seconds):
+        sleep(seconds)
+
+    def timer(self, delay, callback):
+        """Return an unstarted daemon threading.Timer."""
+        timer = threading.Timer(delay / self.speed, callback)
+        timer.daemon = True
+        return timer
+
+    def new_event_loop(self):
+        return asyncio.new_event_loop()
+
+
+CLOCK = Clock()
+vlc = None  # python-vlc, or the simulator's stand-in; set by use_backend()
+
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+DELAY_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2, 5, 10, 20, 30)
+
+
+class Counter:
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+
+class Histogram:
+    """Cumulative-bucket histogram; observe() is a bisect and three additions."""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Reading:
+    """A counter or gauge whose value is read from `read()` only when rendered."""
+
+    def __init__(self, read):
+        self.read = read
+
+
+class Metrics:
+    """Counters, histograms and gauges of the running clock.
+
+    Recording only updates numbers in place; the Prometheus text format is
+    rendered when the Unix socket is read or the textfile is due, so an
+    unread registry costs next to nothing. Updates from the display and
+    libvlc threads are not locked; an occasionally lost increment is fine.
+    """
+
+    def __init__(self):
+        self.families = {}  # name -> (kind, help, {labels: metric})
+
+    def _get(self, kind, name, help_text, labels, factory):
+        family = self.families.setdefault(name, (kind, help_text, {}))
+        key = tuple(sorted(labels.items()))
+        metric = family[2].get(key)
+        if metric is None:
+            metric = family[2][key] = factory()
+        return metric
+
+    def counter(self, name, help_text, **labels):
+        return self._get("counter", name, help_text, labels, Counter)
+
+    def histogram(self, name, help_text, buckets=LATENCY_BUCKETS, **labels):
+        return self._get("histogram", name, help_text, labels, lambda: Histogram(buckets))
+
+    def reading(self, kind, name, help_text, read, **labels):
+        """Expose a value kept elsewhere as a "counter" or "gauge"; re-registering replaces `read`."""
+        reading = self._get(kind, name, help_text, labels, lambda: Reading(read))
+        reading.read = read
+        return reading
+
+    def render(self):
+        lines = []
+        for name, (kind, help_text, series) in self.families.items():
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for key, metric in series.items():
+                labels = ",".join(f'{label}="{value}"' for label, value in key)
+                if kind == "histogram":
+                    prefix = labels + "," if labels else ""
+                    total = 0
+                    for bound, count in zip(metric.buckets, metric.counts):
+                        total += count
+                        lines.append(f'{name}_bucket{{{prefix}le="{bound}"}} {total}')
+                    lines.append(f'{name}_bucket{{{prefix}le="+Inf"}} {metric.count}')
+                    suffix = f"{{{labels}}}" if labels else ""
+                    lines.append(f"{name}_sum{suffix} {metric.sum:.6f}")
+                    lines.append(f"{name}_count{suffix} {metric.count}")
+                else:
+                    value = metric.read() if isinstance(metric, Reading) else metric.value
+                    lines.append(f"{name}{{{labels}}} {value}" if labels else f"{name} {value}")
+        return "\n".join(lines) + "\n"
+
+    async def serve(self, path):
+        """Answer every connection on the Unix socket with the current metrics."""
+        async def handle(reader, writer):
+            writer.write(self.render().encode())
+            await writer.drain()
+            writer.close()
+
+        try:
+            if os.path.exists(path):
+                os.unlink(path)
+            server = await asyncio.start_unix_server(handle, path)
+        except OSError as e:
+            print(f"metrics socket unavailable: {e}")
+            return
+        async with server:
+            await server.serve_forever()
+
+    async def write_textfile(self, path, interval=METRICS_TEXTFILE_INTERVAL):
+        """Periodically write the metrics for node_exporter's textfile collector."""
+        while True:
+            temp_path = path + ".tmp"
+            with open(temp_path, "w") as textfile:
+                textfile.write(self.render())
+            os.replace(temp_path, path)
+            await asyncio.sleep(interval)
+
+
+METRICS = Metrics()
+
 
+class FontRegistry:
+    """Load each (face, size) font once for the whole process."""
 
-def draw_in_box(text, font, rect_start, rect_end, draw, color='white'):
-    """Draw text centered within a rectangular area."""
-    x, y, text_width, text_height = draw.textbbox((0, 0), text, font=font)
+    def __init__(self):
+        self.fonts = {}
+
+    def get(self, size, face=FONT_FACE):
+        key = (face, size)
+        font = self.fonts.get(key)
+        if font is None:
+            try:
+                font = ImageFont.truetype(face, size)
+            except IOError:
+                font = ImageFont.load_default()
+            self.fonts[key] = font
+        return font
+
+
+class TextSpriteCache:
+    """LRU cache of pre-rendered text sprites keyed by (text, font, color)."""
+
+    def __init__(self, max_size=TEXT_SPRITE_CACHE_SIZE):
+        self.max_size = max_size
+        self.sprites = OrderedDict()
+
+    def get(self, text, font, color='white'):
+        """Return an RGBA sprite sized to the text's (right, bottom) bbox corner."""
+        key = (text, font, color)
+        sprite = self.sprites.get(key)
+        if sprite is not None:
+            self.sprites.move_to_end(key)
+            return sprite
+
+        mask = Image.new("L", (1, 1))
+        _, _, right, bottom = ImageDraw.Draw(mask).textbbox((0, 0), text, font=font)
+        mask = Image.new("L", (max(right, 1), max(bottom, 1)), 0)
+        ImageDraw.Draw(mask).text((0, 0), text, fill=255, font=font)
+        sprite = Image.new("RGBA", mask.size, color)
+        sprite.putalpha(mask)
+        sprite.info["sprite_key"] = key
+
+        self.sprites[key] = sprite
+        if len(self.sprites) > self.max_size:
+            self.sprites.popitem(last=False)
+        return sprite
+
+
+def rgb565(image):
+    """Convert a PIL image to a big-endian RGB565 array, the panel's byte order."""
+    rgb = np.asarray(image.convert("RGB"), dtype=np.uint16)
+    pixels = ((rgb[..., 0] & 0xF8) << 8) | ((rgb[..., 1] & 0xFC) << 3) | (rgb[..., 2] >> 3)
+    return pixels.astype(">u2")
+
+
+class TextBlockCache:
+    """LRU cache of text sprites blended onto a static layer and converted to RGB565.
+
+    A block only depends on the layer, the sprite and where it lands, so the
+    clock face converts one new block a minute and reuses everything else.
+    """
+
+    def __init__(self, max_size=TEXT_BLOCK_CACHE_SIZE):
+        self.max_size = max_size
+        self.blocks = OrderedDict()
+
+    def get(self, layer, sprite, pos):
+        """Return (box, block) for the sprite at pos, clipped to the layer."""
+        key = (layer.key, sprite.info["sprite_key"], pos)
+        entry = self.blocks.get(key)
+        if entry is not None:
+            self.blocks.move_to_end(key)
+            return entry
+
+        x, y = pos
+        width, height = layer.image.size
+        box = (max(x, 0), max(y, 0),
+               min(x + sprite.width, width), min(y + sprite.height, height))
+        if box[0] >= box[2] or box[1] >= box[3]:
+            entry = (box, None)
+        else:
+            patch = layer.image.crop(box)
+            patch.paste(sprite, (x - box[0], y - box[1]), sprite)
+            entry = (box, rgb565(patch))
+
+        self.blocks[key] = entry
+        if len(self.blocks) > self.max_size:
+            self.blocks.popitem(last=False)
+        return entry
+
+
+FONTS = FontRegistry()
+TEXT_SPRITES = TextSpriteCache()
+TEXT_BLOCKS = TextBlockCache()
+
+
+def draw_in_box(text, font, rect_start, rect_end, image, color='white'):
+    """Paste a cached text sprite centered within a rectangular area."""
+    sprite = TEXT_SPRITES.get(text, font, color)
+    text_width, text_height = sprite.size
     text_x = rect_start[0] + (rect_end[0] - rect_start[0] - text_width) // 2
     text_y = rect_start[1] + (rect_end[1] - rect_start[1] - text_height) // 2
-    draw.text((text_x, text_y), text, fill=color, font=font)
+    image.paste(sprite, (int(text_x), int(text_y)), sprite)
+
+
+class ConnectivityMonitor:
+    """Probe the network cheaply and publish a cached status.
+
+    A probe reads the interface link state and then opens a TCP connection
+    to the gateway; no HTTP request is made. The interval doubles while the
+    status is stable and drops to the minimum after a change; while the
+    display is dark it stays at CONNECTIVITY_MAX_INTERVAL. Consumers read
+    `online`, `checked_at` and `fresh` and never wait for a probe; one that
+    finds the status older than its TTL calls refresh_if_stale() to ask for one.
+    """
+
+    def __init__(self, host=CONNECTIVITY_HOST, port=CONNECTIVITY_PORT,
+                 interface=CONNECTIVITY_INTERFACE):
+        self.host = host
+        self.port = port
+        self.operstate_path = f"/sys/class/net/{interface}/operstate"
+        self.online = True
+        self.checked_at = None
+        self.latency = None
+        self.interval = CONNECTIVITY_MIN_INTERVAL
+        self.period = CONNECTIVITY_MIN_INTERVAL  # the wait after the last probe
+        self.listeners = []
+        self.wakeup_listener = None  # called with "connectivity" before each probe
+        self.poke = asyncio.Event()
+        self.probe_seconds = METRICS.histogram(
+            "clock_connectivity_probe_seconds", "Connectivity probe duration.")
+
+    @property
+    def ttl(self):
+        return 2 * self.period
+
+    @property
+    def fresh(self):
+        return self.checked_at is not None and CLOCK.monotonic() - self.checked_at < self.ttl
+
+    def link_up(self):
+        try:
+            with open(self.operstate_path) as operstate:
+                return operstate.read().strip() != "down"
+        except OSError:
+            return True
+
+    async def reachable(self):
+        if not self.link_up():
+            return False
+        try:
+            _, writer = await asyncio.wait_for(
+                asyncio.open_connection(self.host, self.port), CONNECTIVITY_TIMEOUT)
+            writer.close()
+            return True
+        except (OSError, asyncio.TimeoutError):
+            return False
+
+    async def probe(self):
+        """Probe now, publish the result and return it."""
+        started = CLOCK.monotonic()
+        online = await self.reachable()
+        self.latency = CLOCK.monotonic() - started
+        self.probe_seconds.observe(self.latency)
+        self.publish(online)
+        return online
+
+    def publish(self, online):
+        changed = online != self.online
+        self.online = online
+        self.checked_at = CLOCK.monotonic()
+        if changed:
+            self.interval = CONNECTIVITY_MIN_INTERVAL
+            for listener in self.listeners:
+                listener(online)
+        else:
+            self.interval = min(self.interval * 2, CONNECTIVITY_MAX_INTERVAL)
 
+    @property
+    def poor(self):
+        """Online but slow enough that low bitrate streams are the safer choice."""
+        return self.online and self.latency is not None and self.latency > CONNECTIVITY_POOR_LATENCY
 
-def internet_connection():
-    """Check if internet connection is available."""
-    try:
-        response = requests.get("http://192.168.0.1", timeout=2)
-        return True
-    except requests.ConnectionError:
+    def request_probe(self):
+        self.poke.set()
+
+    def refresh_if_stale(self):
+        """Ask for a probe if the cached status has outlived its TTL; True if it is fresh."""
+        if self.fresh:
+            return True
+        self.request_probe()
         return False
 
+    async def run(self, active):
+        """Probe on the adaptive interval while the `active` event is set, slowly otherwise."""
+        while True:
+            if self.wakeup_listener is not None:
+                self.wakeup_listener("connectivity")
+            await self.probe()
+            self.period = self.interval if active.is_set() else max(self.interval, CONNECTIVITY_MAX_INTERVAL)
+            try:
+                await asyncio.wait_for(self.poke.wait(), self.period)
+            except asyncio.TimeoutError:
+                pass
+            self.poke.clear()
+
 
 def draw_wifi_status(draw, status):
     """Draw WiFi connection status indicator."""
@@ -48,38 +478,720 @@ def draw_wifi_status(draw, status):
         draw.rectangle([rect_start, rect_mid_end], fill='red', outline='white', width=2)
 
 
+# Shared player states
+PLAYBACK_IDLE = "idle"
+PLAYBACK_CONNECTING = "connecting"
+PLAYBACK_PLAYING = "playing"
+PLAYBACK_ERROR = "error"
+
+
+class AudioEngine:
+    """Own the single libvlc instance and player shared by all screens.
+
+    Screens get a PlaybackSession each; a session with a higher priority
+    takes the player over from a lower one (alarm preempts radio). libvlc
+    is only loaded by start(), after the first frame, or on first use.
+
+    warm() keeps extra players buffering other MRLs muted; playing one of
+    them swaps it in as `player`, so the switch needs no new connection.
+    """
+
+    def __init__(self):
+        self.instance = None
+        self.player = None
+        self.start_lock = threading.Lock()
+        self.media_cache = OrderedDict()
+        self.owner = None
+        self.state = PLAYBACK_IDLE
+        self.player_states = {}  # id(player) -> state, for warm players too
+        self.warm_players = {}  # mrl -> muted player
+        self.spare_players = []
+
+    def start(self):
+        """Create the libvlc instance and player; safe to call from any thread."""
+        with self.start_lock:
+            if self.player is not None:
+                return
+            self.instance = vlc.Instance()
+            self.player = self.new_player()
+
+    def new_player(self):
+        player = self.instance.media_player_new()
+        self.player_states[id(player)] = PLAYBACK_IDLE
+        events = player.event_manager()
+        for event_type in (vlc.EventType.MediaPlayerOpening,
+                           vlc.EventType.MediaPlayerPlaying,
+                           vlc.EventType.MediaPlayerBuffering,
+                           vlc.EventType.MediaPlayerStopped,
+                           vlc.EventType.MediaPlayerEncounteredError,
+                           vlc.EventType.MediaPlayerEndReached):
+            events.event_attach(event_type, lambda event, player=player: self._on_vlc_event(player, event))
+        return player
+
+    def session(self, name, priority):
+        return PlaybackSession(self, name, priority)
+
+    def media(self, mrl):
+        """Return a cached vlc.Media for the MRL (URL or local path)."""
+        media = self.media_cache.get(mrl)
+        if media is not None:
+            self.media_cache.move_to_end(mrl)
+            return media
+        media = self.instance.media_new(mrl)
+        self.media_cache[mrl] = media
+        if len(self.media_cache) > MEDIA_CACHE_SIZE:
+            _, evicted = self.media_cache.popitem(last=False)
+            evicted.release()
+        return media
+
+    def acquire(self, session):
+        """Hand the player to the session unless a higher priority one owns it."""
+        owner = self.owner
+        if owner is session:
+            return True
+        if owner is not None:
+            if owner.priority > session.priority:
+                return False
+            self.owner = None
+            self.player.stop()
+            self.warm(())
+            if owner.on_preempted is not None:
+                owner.on_preempted()
+        self.owner = session
+        return True
+
+    def release(self, session):
+        if self.owner is session:
+            self.player.stop()
+            self.warm(())
+            self.owner = None
+            self.state = PLAYBACK_IDLE
+
+    def warm(self, mrls):
+        """Keep muted players buffering exactly these MRLs; () stops them all."""
+        for mrl in list(self.warm_players):
+            if mrl not in mrls:
+                player = self.warm_players.pop(mrl)
+                player.stop()
+                self.spare_players.append(player)
+        for mrl in mrls:
+            if mrl in self.warm_players or (self.owner is not None and self.owner.mrl == mrl):
+                continue
+            player = self.spare_players.pop() if self.spare_players else self.new_player()
+            player.set_media(self.media(mrl))
+            player.audio_set_mute(True)
+            self.player_states[id(player)] = PLAYBACK_CONNECTING
+            player.play()
+            self.warm_players[mrl] = player
+
+    def swap_in(self, mrl, previous_mrl):
+        """Make the warm player for `mrl` the main one; False if there is none that works.
+
+        The old main player keeps buffering `previous_mrl` muted, so
+        switching back is just as quick; the next warm() call decides
+        whether to keep it.
+        """
+        player = self.warm_players.pop(mrl, None)
+        if player is None:
+            return False
+        state = self.player_states[id(player)]
+        if state not in (PLAYBACK_CONNECTING, PLAYBACK_PLAYING):
+            player.stop()
+            self.spare_players.append(player)
+            return False
+        previous, self.player = self.player, player
+        self.state = state
+        previous.audio_set_mute(True)
+        if previous_mrl is not None and self.player_states[id(previous)] in (PLAYBACK_CONNECTING,
+                                                                              PLAYBACK_PLAYING):
+            self.warm_players[previous_mrl] = previous
+        else:
+            previous.stop()
+            self.spare_players.append(previous)
+        return True
+
+    def _on_vlc_event(self, player, event):
+        """libvlc callback; runs on a libvlc thread and must not call into libvlc."""
+        event_type = event.type
+        state = self.player_states[id(player)]
+        if event_type == vlc.EventType.MediaPlayerOpening:
+            state = PLAYBACK_CONNECTING
+        elif event_type == vlc.EventType.MediaPlayerPlaying:
+            state = PLAYBACK_PLAYING
+        elif event_type == vlc.EventType.MediaPlayerEncounteredError:
+            state = PLAYBACK_ERROR
+        elif event_type in (vlc.EventType.MediaPlayerStopped, vlc.EventType.MediaPlayerEndReached):
+            state = PLAYBACK_IDLE
+        self.player_states[id(player)] = state
+        if player is not self.player:
+            return
+        self.state = state
+
+        owner = self.owner
+        if owner is not None and owner.listener is not None:
+            owner.listener(event)
+
+
+class PlaybackSession:
+    """A screen's handle on the shared player."""
+
+    def __init__(self, engine, name, priority):
+        self.engine = engine
+        self.name = name
+        self.priority = priority
+        self.mrl = None
+        self.listener = None  # called with libvlc events while this session owns the player
+        self.on_preempted = None
+        self.muted = False
+
+    @property
+    def active(self):
+        return self.engine.owner is self
+
+    @property
+    def state(self):
+        return self.engine.state if self.active else PLAYBACK_IDLE
+
+    def play(self, mrl):
+        """Play the MRL; a no-op if it is already playing. False if preempted."""
+        if self.active and self.mrl == mrl and self.engine.state in (PLAYBACK_CONNECTING, PLAYBACK_PLAYING):
+            return True
+        self.engine.start()
+        if not self.engine.acquire(self):
+            return False
+        if self.engine.swap_in(mrl, self.mrl):
+            self.mrl = mrl
+            self.engine.player.audio_set_mute(self.muted)
+            return True
+        player = self.engine.player
+        player.stop()
+        player.set_media(self.engine.media(mrl))
+        self.mrl = mrl
+        self.engine.state = self.engine.player_states[id(player)] = PLAYBACK_CONNECTING
+        player.audio_set_mute(self.muted)
+        player.play()
+        return True
+
+    def set_muted(self, muted):
+        self.muted = muted
+        if self.active:
+            self.engine.player.audio_set_mute(muted)
+
+    def warm(self, mrls):
+        """Buffer these MRLs alongside the playing one; only while this session owns the player."""
+        if self.active:
+            self.engine.warm(mrls)
+
+    def stop(self):
+        self.engine.release(self)
+
+    def is_playing(self):
+        return self.active and self.engine.player.is_playing()
+
+
+class MusicLibrary:
+    """In-memory index of playable local files for the alarm fallback.
+
+    Files are validated (libvlc must report a duration) when the index is
+    built in the background, and rescanned only when a directory mtime
+    changes. next_track() pops from a shuffled queue without touching
+    the filesystem and avoids repeating a track until all have played.
+    """
+
+    def __init__(self, audio, root=MUSIC_DIR):
+        self.audio = audio
+        self.root = root
+        self.tracks = {}  # path -> (mtime, size, duration in ms)
+        self.dir_mtimes = {}
+        self.queue = deque()
+        self.last_played = None
+        self.lock = threading.Lock()
+        self.wakeup_listener = None  # called with "music" before each rescan check
+
+    def next_track(self):
+        """Return a path to play, or None if nothing playable is indexed."""
+        with self.lock:
+            if not self.queue:
+                self.refill()
+            if not self.queue:
+                return None
+            self.last_played = self.queue.popleft()
+            return self.last_played
+
+    def refill(self):
+        paths = list(self.tracks)
+        random.shuffle(paths)
+        if len(paths) > 1 and paths[0] == self.last_played:
+            paths[0], paths[-1] = paths[-1], paths[0]
+        self.queue.extend(paths)
+
+    def changed(self):
+        """True if any indexed directory was modified since the last scan."""
+        if not self.dir_mtimes:
+            return True
+        for path, mtime in self.dir_mtimes.items():
+            try:
+                if os.stat(path).st_mtime != mtime:
+                    return True
+            except OSError:
+                return True
+        return False
+
+    def scan(self):
+        """(Re)build the index; unchanged files keep their earlier validation."""
+        self.audio.start()
+        tracks = {}
+        dir_mtimes = {}
+        for dirpath, _, filenames in os.walk(self.root):
+            try:
+                dir_mtimes[dirpath] = os.stat(dirpath).st_mtime
+            except OSError:
+                continue
+            for filename in filenames:
+                if not filename.lower().endswith(MUSIC_EXTENSIONS):
+                    continue
+                path = os.path.join(dirpath, filename)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                known = self.tracks.get(path)
+                if known and known[:2] == (stat.st_mtime, stat.st_size):
+                    tracks[path] = known
+                    continue
+                duration = self.probe_duration(path)
+                if duration > 0:
+                    tracks[path] = (stat.st_mtime, stat.st_size, duration)
+
+        with self.lock:
+            if tracks.keys() != self.tracks.keys():
+                self.queue.clear()
+            self.tracks = tracks
+            self.dir_mtimes = dir_mtimes
+
+    def probe_duration(self, path):
+        media = self.audio.instance.media_new_path(path)
+        try:
+            media.parse()
+            return media.get_duration()
+        finally:
+            media.release()
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            if self.wakeup_listener is not None:
+                self.wakeup_listener("music")
+            if await loop.run_in_executor(None, self.changed):
+                await loop.run_in_executor(None, self.scan)
+            await asyncio.sleep(MUSIC_RESCAN_INTERVAL)
+
+
+def fetch_playlist(url):
+    with urlopen(url, timeout=STREAM_RESOLVE_TIMEOUT) as response:
+        return response.read(64 * 1024).decode("utf-8", "replace")
+
+
+def parse_playlist(text, base_url):
+    """The first entry of a .pls or .m3u playlist, or None."""
+    lines = [line.strip() for line in text.splitlines() if line.strip()]
+    if lines and lines[0].lower() == "[playlist]":
+        for line in lines:
+            key, _, value = line.partition("=")
+            if key.lower().startswith("file") and value:
+                return urljoin(base_url, value.strip())
+        return None
+    for line in lines:
+        if not line.startswith("#"):
+            return urljoin(base_url, line)
+    return None
+
+
+class StreamResolver:
+    """Follow .pls/.m3u playlist URLs to the stream they point at, and remember it.
+
+    resolve() fetches over the network and must run off the event loop;
+    lookup() only reads the cache and returns the URL itself until it has
+    been resolved (libvlc can open playlists too, just more slowly).
+    """
+
+    def __init__(self, fetch=fetch_playlist):
+        self.fetch = fetch
+        self.cache = {}  # url -> (stream url, monotonic time resolved)
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def is_playlist(url):
+        return urlparse(url).path.lower().endswith((".pls", ".m3u"))
+
+    def lookup(self, url):
+        entry = self.cache.get(url)
+        return entry[0] if entry else url
+
+    def resolve(self, url, depth=3):
+        if not self.is_playlist(url):
+            return url
+        with self.lock:
+            entry = self.cache.get(url)
+            if entry and CLOCK.monotonic() - entry[1] < STREAM_RESOLVE_TTL:
+                return entry[0]
+            try:
+                stream_url = parse_playlist(self.fetch(url), url)
+            except (OSError, ValueError) as e:
+                print(f"Cannot resolve {url}: {e}")
+                stream_url = None
+            if stream_url is None:
+                # Keep an older answer, if any, rather than none.
+                return self.lookup(url)
+            if depth > 1 and self.is_playlist(stream_url):
+                stream_url = self.resolve(stream_url, depth - 1)
+            self.cache[url] = (stream_url, CLOCK.monotonic())
+            return stream_url
+
+
+class StationList:
+    """Radio stations read from STATIONS_PATH at startup.
+
+    The file is a JSON list of {"id", "name", "url", "low_url"}; only "url"
+    is required and "low_url" is a lower bitrate variant for poor
+    connections. Without the file there is one station, STREAM_URL.
+    """
+
+    def __init__(self, path=STATIONS_PATH, resolver=None):
+        self.path = path
+        self.resolver = resolver or StreamResolver()
+        self.wakeup_listener = None  # called with "stations" before each refresh
+        self.stations = self.load()
+
+    def load(self):
+        try:
+            with open(self.path) as stations_file:
+                entries = json.load(stations_file)
+        except FileNotFoundError:
+            entries = [{"id": "evropa2", "name": "Evropa 2", "url": STREAM_URL}]
+        stations = []
+        for entry in entries:
+            station = dict(entry)
+            station.setdefault("name", station.get("id") or urlparse(station["url"]).netloc)
+            station.setdefault("id", station["name"])
+            stations.append(station)
+        if not stations:
+            raise ValueError(f"{self.path}: no stations")
+        return stations
+
+    def __len__(self):
+        return len(self.stations)
+
+    def __getitem__(self, index):
+        return self.stations[index % len(self.stations)]
+
+    def get(self, station_id):
+        """The station with this id, or the first one."""
+        for station in self.stations:
+            if station["id"] == station_id:
+                return station
+        return self.stations[0]
+
+    def stream_url(self, station, low=False):
+        """The URL to hand to libvlc, resolved from the cache; never blocks."""
+        url = station.get("low_url") if low else None
+        return self.resolver.lookup(url or station["url"])
+
+    def resolve_all(self):
+        for station in self.stations:
+            for key in ("url", "low_url"):
+                if station.get(key):
+                    self.resolver.resolve(station[key])
+
+    async def run(self):
+        """Keep the playlist cache fresh, off the event loop."""
+        loop = asyncio.get_running_loop()
+        while True:
+            if self.wakeup_listener is not None:
+                self.wakeup_listener("stations")
+            await loop.run_in_executor(None, self.resolve_all)
+            await asyncio.sleep(STREAM_RESOLVE_TTL / 2)
+
+
+class StreamCache:
+    """A rolling recording of the alarm station on local storage.
+
+    The stream is fetched directly (no decoding) on a worker thread and
+    written front to back through a STREAM_CACHE_WRITE_SIZE buffer into a
+    .part file. A full file replaces the oldest of the STREAM_CACHE_SEGMENTS
+    segments, so the cache stays under its cap, only ever holds whole
+    segments, and survives restarts. segments() lists them oldest first.
+
+    The directory is read once at startup; after that the recorder keeps
+    the (mtime, path, size) list in memory, so nothing on the alarm's
+    fallback path touches the disk.
+    """
+
+    def __init__(self, root, open_stream):
+        self.root = root
+        self.open_stream = open_stream
+        self.url = None
+        self.stop_event = None
+        self.listeners = []  # called on the worker thread when a segment is complete
+        self.lock = threading.Lock()
+        self.entries = []  # (mtime, path, size) of the complete segments, oldest first
+        for name in os.listdir(root) if os.path.isdir(root) else ():
+            path = os.path.join(root, name)
+            try:
+                if name.endswith(".part"):
+                    # Left over if the clock stopped while recording.
+                    os.remove(path)
+                elif name.startswith("segment-"):
+                    status = os.stat(path)
+                    self.entries.append((status.st_mtime, path, status.st_size))
+            except FileNotFoundError:
+                pass
+        self.entries.sort()
+        self.bytes_written = METRICS.counter(
+            "clock_stream_cache_written_bytes_total", "Bytes of stream recorded to the cache.")
+        METRICS.reading("gauge", "clock_stream_cache_bytes", "Bytes of complete segments in the cache.",
+                        lambda: sum(size for _, _, size in self.entries))
+
+    def segments(self):
+        with self.lock:
+            return [path for _, path, _ in self.entries]
+
+    def stale(self):
+        """True until the ring is full of segments newer than STREAM_CACHE_MAX_AGE."""
+        with self.lock:
+            return len(self.entries) < STREAM_CACHE_SEGMENTS or self.entries[0][0] < time() - STREAM_CACHE_MAX_AGE
+
+    def record(self, url):
+        """Record `url` from now on; a no-op if it is being recorded already."""
+        if url == self.url:
+            return
+        self.stop()
+        self.url = url
+        self.stop_event = threading.Event()
+        threading.Thread(target=self._record, args=(url, self.stop_event), daemon=True).start()
+
+    def stop(self):
+        if self.stop_event is not None:
+            self.stop_event.set()
+        self.url = None
+        self.stop_event = None
+
+    def _record(self, url, stop_event):
+        os.makedirs(self.root, exist_ok=True)
+        while not stop_event.is_set():
+            try:
+                stream = self.open_stream(url)
+                try:
+                    self._write_segments(stream, stop_event)
+                finally:
+                    stream.close()
+            except (OSError, ValueError) as e:
+                print(f"Stream cache: {url}: {e}")
+                stop_event.wait(STREAM_CACHE_RETRY)
+
+    def _write_segments(self, stream, stop_event):
+        headers = getattr(stream, "headers", None)
+        extension = STREAM_CACHE_TYPES.get(headers.get_content_type() if headers else None, ".mp3")
+        # Per thread, so a recorder still winding down never shares it.
+        part_path = os.path.join(self.root, f"recording-{threading.get_ident()}.part")
+        while not stop_event.is_set():
+            written = 0
+            try:
+                with open(part_path, "wb", buffering=STREAM_CACHE_WRITE_SIZE) as part:
+                    while written < STREAM_CACHE_SEGMENT_SIZE and not stop_event.is_set():
+                        chunk = stream.read(min(64 * 1024, STREAM_CACHE_SEGMENT_SIZE - written))
+                        if not chunk:
+                            raise OSError("stream ended")
+                        part.write(chunk)
+                        written += len(chunk)
+                        self.bytes_written.inc(len(chunk))
+            finally:
+                if written < STREAM_CACHE_SEGMENT_SIZE:
+                    # A partial segment is dropped rather than kept.
+                    os.remove(part_path)
+            if written < STREAM_CACHE_SEGMENT_SIZE:
+                return
+            path = self.next_segment_path(extension)
+            os.replace(part_path, path)
+            with self.lock:
+                self.entries = [entry for entry in self.entries if entry[1] != path]
+                self.entries.append((os.path.getmtime(path), path, written))
+            for listener in self.listeners:
+                listener()
+
+    def next_segment_path(self, extension):
+        """A free slot, or the oldest segment's (which is overwritten)."""
+        with self.lock:
+            segments = [path for _, path, _ in self.entries]
+        used = {os.path.basename(path).split(".")[0] for path in segments}
+        for slot in range(STREAM_CACHE_SEGMENTS):
+            if f"segment-{slot:02d}" not in used:
+                return os.path.join(self.root, f"segment-{slot:02d}{extension}")
+        oldest = segments[0]
+        if not oldest.endswith(extension):
+            with self.lock:
+                del self.entries[0]
+            try:
+                os.remove(oldest)
+            except FileNotFoundError:
+                pass
+        return os.path.splitext(oldest)[0] + extension
+
+
+RADIO_STATUS_TEXT = {
+    PLAYBACK_CONNECTING: "connecting...",
+    PLAYBACK_PLAYING: "playing",
+    PLAYBACK_ERROR: "stream error",
+}
+
+
+class RadioController:
+    """Send play/stop to the player once per selection and observe its state.
+
+    The Radio screen only calls select() or tune() when the selection
+    changes and draws `state`; listeners are called on the event loop
+    whenever the player reports a change. While playing, the neighbouring
+    stations are kept buffering (RADIO_WARM_ADJACENT) so tune() switches
+    at once, and repeated rebuffering moves to the station's low_url.
+    """
+
+    def __init__(self, audio, stations, connectivity):
+        self.stations = stations
+        self.connectivity = connectivity
+        self.station_index = 0
+        self.low = False
+        self.buffering = False
+        self.rebuffers = deque()
+        self.selected = False
+        self.session = audio.session("radio", PRIORITY_RADIO)
+        self.session.listener = self._on_vlc_event
+        self.session.on_preempted = self._on_preempted
+        self.listeners = []
+        self.loop = None
+
+    def attach(self, loop):
+        self.loop = loop
+
+    @property
+    def state(self):
+        return self.session.state
+
+    @property
+    def station(self):
+        return self.stations[self.station_index]
+
+    def url(self, station):
+        self.connectivity.refresh_if_stale()
+        low = (self.low and station is self.station) or self.connectivity.poor
+        return self.stations.stream_url(station, low)
+
+    def select(self, playing):
+        if playing == self.selected:
+            return
+        if playing:
+            # A higher priority session (the alarm pre-roll) may refuse us the player.
+            self.selected = self.session.play(self.url(self.station))
+            if self.selected:
+                self.warm_adjacent()
+        else:
+            self.selected = False
+            self.session.stop()
+        self.notify()
+
+    def tune(self, offset):
+        """Move to the previous or next station, playing it if the radio is on."""
+        self.station_index = (self.station_index + offset) % len(self.stations)
+        self.low = False
+        self.rebuffers.clear()
+        if self.selected:
+            self.selected = self.session.play(self.url(self.station))
+            if self.selected:
+                self.warm_adjacent()
+        self.notify()
+
+    def warm_adjacent(self):
+        if not RADIO_WARM_ADJACENT or len(self.stations) < 2 or self.connectivity.poor:
+            self.session.warm(())
+            return
+        self.session.warm({self.url(self.stations[self.station_index + offset]) for offset in (-1, 1)})
+
+    def on_rebuffer(self):
+        """Too many stalls in RADIO_REBUFFER_WINDOW: drop to the low bitrate stream."""
+        now = CLOCK.monotonic()
+        self.rebuffers.append(now)
+        while self.rebuffers[0] < now - RADIO_REBUFFER_WINDOW:
+            self.rebuffers.popleft()
+        if len(self.rebuffers) >= RADIO_REBUFFER_LIMIT and not self.low and self.station.get("low_url"):
+            print(f"radio: switching {self.station['name']} to its low bitrate stream")
+            self.low = True
+            self.selected = self.session.play(self.url(self.station))
+            self.notify()
+
+    def _on_preempted(self):
+        """The alarm took the player over; the radio is stopped now."""
+        self.selected = False
+        self.notify()
+
+    def _on_vlc_event(self, event):
+        """libvlc callback; runs on a libvlc thread."""
+        if self.loop is None:
+            return
+        if event.type == vlc.EventType.MediaPlayerBuffering:
+            buffering = event.u.new_cache < 100
+            if buffering and not self.buffering and self.session.state == PLAYBACK_PLAYING:
+                self.loop.call_soon_threadsafe(self.on_rebuffer)
+            self.buffering = buffering
+        self.loop.call_soon_threadsafe(self.notify)
+
+    def notify(self):
+        for listener in self.listeners:
+            listener()
+
+
 class Radio:
-    """Handle radio player functionality and UI."""
+    """Radio screen: a view of the RadioController's state.
 
-    def __init__(self, width, height):
+    Row 1 is stop/play, row 2 browses the stations.
+    """
+
+    def __init__(self, width, height, radio):
         self.width = width
         self.height = height
         self.cursor_v_index = 0
         self.cursor_h_index = 0
+        self.radio = radio
+        radio.listeners.append(self.on_radio_change)
 
-        self.url = 'https://ice.actve.net/fm-evropa2-128'
-        self.instance = vlc.Instance()
-        self.player = self.instance.media_player_new()
-        self.media = self.instance.media_new(self.url)
-        self.player.set_media(self.media)
+    def on_radio_change(self):
+        # Follow the controller, e.g. when the alarm preempted the radio.
+        self.cursor_h_index = 1 if self.radio.selected else 0
 
     def set_v_cursor(self, cursor_offset):
         self.cursor_v_index += cursor_offset
-        self.cursor_v_index %= 2
+        self.cursor_v_index %= 3
 
     def set_h_cursor(self, cursor_offset):
+        if self.cursor_v_index == 2:
+            self.radio.tune(cursor_offset)
+            return
         self.cursor_h_index += cursor_offset
         self.cursor_h_index %= 2
+        self.radio.select(self.cursor_h_index == 1)
 
-    def cdraw(self, image):
-        self.draw_top_menu(image)
+    def static_key(self):
+        return self.cursor_v_index, self.cursor_h_index % 2, self.radio.station_index
 
-    def draw_top_menu(self, image):
+    def redraw_in(self):
+        return None
+
+    def draw_static(self, image):
         self.draw = ImageDraw.Draw(image)
         border = 2
         rect_start = (0, 0)
         rect_mid_end = (self.width, self.height * 0.25)
         rect_mid_start = (0, self.height * 0.25)
+        rect_buttons_end = (self.width, self.height * 0.75)
+        rect_station_start = (0, self.height * 0.75)
         rect_end = (self.width, self.height)
         button_v_offset = 69
 
@@ -89,19 +1201,13 @@ class Radio:
                   (self.width - 10, self.height - button_v_offset)]
 
         # Define fonts
-        font_size = int(self.height * 0.15)
-        try:
-            font = ImageFont.truetype("arial.ttf", font_size)
-        except IOError:
-            font = ImageFont.load_default()
+        font = FONTS.get(int(self.height * 0.15))
 
         # Draw UI elements based on cursor position
-        if self.cursor_v_index == 0:
-            self.draw.rectangle([rect_start, rect_mid_end], fill='green', outline='white', width=border)
-            self.draw.rectangle([rect_mid_start, rect_end], outline='white', width=border)
-        else:
-            self.draw.rectangle([rect_start, rect_mid_end], outline='white', width=border)
-            self.draw.rectangle([rect_mid_start, rect_end], fill='green', outline='white', width=border)
+        for row, box in enumerate(([rect_start, rect_mid_end], [rect_mid_start, rect_buttons_end],
+                                   [rect_station_start, rect_end])):
+            self.draw.rectangle(box, fill=('green' if self.cursor_v_index == row else None),
+                                outline='white', width=border)
 
         self.draw.rectangle([button1[0], button1[1]],
                            fill=('green' if self.cursor_h_index % 2 == 0 else 'grey'),
@@ -111,28 +1217,209 @@ class Radio:
                            outline='white', width=border)
 
         # Draw text
-        draw_in_box("radio", font, rect_start, rect_mid_end, self.draw)
-        draw_in_box("stop", font, button1[0], button1[1], self.draw)
-        draw_in_box("play", font, button2[0], button2[1], self.draw)
+        draw_in_box("radio", font, rect_start, rect_mid_end, image)
+        draw_in_box("stop", font, button1[0], button1[1], image)
+        draw_in_box("play", font, button2[0], button2[1], image)
+        draw_in_box(self.radio.station["name"], FONTS.get(int(int(self.height * 0.15) * 0.75)),
+                    rect_station_start, rect_end, image)
 
-        # Control player based on selection
-        if self.cursor_h_index % 2 == 1:
-            self.player.play()
-        else:
-            self.player.stop()
+    def draw_dynamic(self, image):
+        status = RADIO_STATUS_TEXT.get(self.radio.state)
+        if status and self.radio.low:
+            status += " (low)"
+        if status:
+            font_smaller = FONTS.get(int(int(self.height * 0.15) * 0.75))
+            draw_in_box(status, font_smaller, (0, self.height * 0.25),
+                        (self.width, self.height * 0.25 + 69), image)
+
+
+class AlsaMixer:
+    """In-process ALSA mixer (pyalsaaudio) with a persistent handle."""
+
+    def __init__(self, control=MIXER_CONTROL):
+        self.mixer = alsaaudio.Mixer(control)
+
+    def get_volume(self):
+        return max(0, min(100, self.mixer.getvolume()[0]))
+
+    def set_volume(self, volume):
+        try:
+            self.mixer.setvolume(volume)
+            return True
+        except alsaaudio.ALSAAudioError:
+            return False
+
+    def poll_fd(self):
+        descriptors = self.mixer.polldescriptors()
+        return descriptors[0][0] if descriptors else None
+
+    def handle_events(self):
+        self.mixer.handleevents()
+
+
+class AmixerMixer:
+    """Fallback mixer that forks amixer; used when pyalsaaudio is missing."""
+
+    def __init__(self, control=MIXER_CONTROL):
+        self.control = control
+
+    def get_volume(self):
+        try:
+            result = subprocess.run(
+                ["amixer", "sget", self.control],
+                check=True,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                text=True,
+            )
+            match = re.search(r"\[(\d{1,3})%\]", result.stdout)
+            if match:
+                value = int(match.group(1))
+                return max(0, min(100, value))
+        except (subprocess.CalledProcessError, FileNotFoundError):
+            return None
+        return None
+
+    def set_volume(self, volume):
+        try:
+            subprocess.run([
+                "amixer",
+                "sset",
+                self.control,
+                f"{volume}%",
+            ], check=True, stdout=subprocess.DEVNULL)
+            return True
+        except (subprocess.CalledProcessError, FileNotFoundError):
+            return False
+
+    def poll_fd(self):
+        return None
+
+    def handle_events(self):
+        pass
+
+
+def open_mixer_backend(control=MIXER_CONTROL):
+    """Prefer the in-process ALSA mixer, fall back to forking amixer."""
+    if alsaaudio is not None:
+        try:
+            return AlsaMixer(control)
+        except alsaaudio.ALSAAudioError:
+            pass
+    return AmixerMixer(control)
+
+
+class VolumeMixer:
+    """Apply volume changes off the input path and watch for external ones.
+
+    set_volume() only records the target; a worker thread applies it, at
+    most once per MIXER_APPLY_INTERVAL, so a burst of presses results in
+    the first and the last level being applied. Listeners are called with
+    (volume, failed) on the event loop when a change fails or when another
+    program changes the volume; set_listeners are called with the volume by
+    set_volume() itself. The backend is opened and the current level read on
+    the worker thread, so `volume` is None until `ready` is set.
+    """
+
+    def __init__(self, open_backend):
+        self.open_backend = open_backend
+        self.backend = None
+        self.ready = threading.Event()
+        self.backend_lock = threading.Lock()
+        self.pending = threading.Condition()
+        self.target = None
+        self.volume = None
+        self.listeners = []
+        self.set_listeners = []
+        self.loop = None
+        threading.Thread(target=self._worker, daemon=True).start()
+
+    def attach(self, loop):
+        """Deliver notifications on the loop and watch the ALSA mixer fd."""
+        self.loop = loop
+        if self.ready.is_set():
+            self._watch()
+
+    def _watch(self):
+        fd = self.backend.poll_fd()
+        if fd is not None:
+            self.loop.add_reader(fd, self._on_mixer_event)
+
+    def _open(self):
+        try:
+            backend = self.open_backend()
+            volume = backend.get_volume()
+        except Exception as e:
+            # ALSAAudioError and friends; `ready` must be set whatever happens.
+            print(f"Mixer: cannot open the ALSA mixer ({e!r}), using amixer")
+            backend = AmixerMixer()
+            volume = backend.get_volume()
+        with self.backend_lock:
+            self.backend = backend
+        with self.pending:
+            if self.volume is None:
+                self.volume = volume
+        self.ready.set()
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self._watch)
+
+    def set_volume(self, volume):
+        with self.pending:
+            self.volume = volume
+            self.target = volume
+            self.pending.notify()
+        for listener in self.set_listeners:
+            listener(volume)
+
+    def _worker(self):
+        self._open()
+        while True:
+            with self.pending:
+                while self.target is None:
+                    self.pending.wait()
+                volume = self.target
+                self.target = None
+            with self.backend_lock:
+                ok = self.backend.set_volume(volume)
+            if not ok:
+                self._notify(volume, True)
+            CLOCK.sleep(MIXER_APPLY_INTERVAL)
+
+    def _on_mixer_event(self):
+        with self.backend_lock:
+            self.backend.handle_events()
+            volume = self.backend.get_volume()
+        with self.pending:
+            external = self.target is None and volume != self.volume
+            if external:
+                self.volume = volume
+        if external:
+            self._notify(volume, False)
+
+    def _notify(self, volume, failed):
+        for listener in self.listeners:
+            if self.loop is not None:
+                self.loop.call_soon_threadsafe(listener, volume, failed)
+            else:
+                listener(volume, failed)
 
 
 class VolumeControl:
     """Provide a simple screen to trigger volume adjustments."""
 
-    def __init__(self, width, height):
+    def __init__(self, width, height, mixer):
         self.width = width
         self.height = height
         self.cursor_v_index = 0
         self.cursor_h_index = 1
-        self.feedback_counter = 0
+        self.feedback_until = 0
         self.last_message = ""
-        self.target_volume = self._read_current_volume() or 100
+        self.mixer = mixer
+        mixer.listeners.append(self.on_mixer_change)
+
+    @property
+    def target_volume(self):
+        return self.mixer.volume if self.mixer.volume is not None else 100
 
     def set_v_cursor(self, cursor_offset):
         self.cursor_v_index += cursor_offset
@@ -142,8 +1429,18 @@ class VolumeControl:
         if self.cursor_v_index == 1:
             self._adjust_volume(cursor_offset)
 
-    def cdraw(self, image):
-        self.draw_top_menu(image)
+    def repeats(self, label):
+        """-5/+5 repeat while held."""
+        return label in ("X", "Y") and self.cursor_v_index == 1
+
+    def static_key(self):
+        return self.cursor_v_index, self.cursor_h_index
+
+    def redraw_in(self):
+        """Seconds until the feedback message disappears, if one is shown."""
+        if not self.last_message:
+            return None
+        return max(0, self.feedback_until - CLOCK.monotonic())
 
     def _adjust_volume(self, cursor_offset):
         if cursor_offset == 0:
@@ -153,52 +1450,25 @@ class VolumeControl:
         new_volume = max(0, min(100, self.target_volume + delta))
         if new_volume == self.target_volume:
             self.last_message = "volume limit reached"
-            self.feedback_counter = 30
+            self.feedback_until = CLOCK.monotonic() + 3
             return
 
-        self.target_volume = new_volume
         self.cursor_h_index = 1 if delta > 0 else 0
-        self._set_volume(self.target_volume)
+        self._set_volume(new_volume)
 
     def _set_volume(self, volume):
-        try:
-            subprocess.run([
-                "amixer",
-                "sset",
-                "Master",
-                f"{volume}%",
-            ], check=True)
-            self.last_message = f"volume set to {volume}%"
-        except (subprocess.CalledProcessError, FileNotFoundError):
-            self.last_message = "volume command failed"
-        self.feedback_counter = 50
-
-    def _read_current_volume(self):
-        try:
-            result = subprocess.run(
-                ["amixer", "sget", "Master"],
-                check=True,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                text=True,
-            )
-            match = re.search(r"\[(\d{1,3})%\]", result.stdout)
-            if match:
-                value = int(match.group(1))
-                return max(0, min(100, value))
-        except (subprocess.CalledProcessError, FileNotFoundError):
-            return None
-        return None
-
-    def draw_top_menu(self, image):
-        self.draw = ImageDraw.Draw(image)
-        border = 2
+        self.mixer.set_volume(volume)
+        self.last_message = f"volume set to {volume}%"
+        self.feedback_until = CLOCK.monotonic() + 5
 
-        rect_title_start = (0, 0)
-        rect_title_end = (self.width, self.height * 0.25)
-        rect_action_start = (0, self.height * 0.25)
-        rect_action_end = (self.width, self.height)
+    def on_mixer_change(self, volume, failed):
+        if failed:
+            self.last_message = "volume command failed"
+        else:
+            self.last_message = f"volume changed to {volume}%"
+        self.feedback_until = CLOCK.monotonic() + 5
 
+    def _button_rects(self):
         action_padding = 20
         button_bottom = self.height - action_padding - 30
         button_minus = [
@@ -209,8 +1479,17 @@ class VolumeControl:
             (self.width * 0.5 + 5, self.height * 0.25 + action_padding),
             (self.width - 10, button_bottom),
         ]
-        message_area_start = (10, button_bottom + 5)
-        message_area_end = (self.width - 10, self.height - 10)
+        return button_minus, button_plus, button_bottom
+
+    def draw_static(self, image):
+        self.draw = ImageDraw.Draw(image)
+        border = 2
+
+        rect_title_start = (0, 0)
+        rect_title_end = (self.width, self.height * 0.25)
+        rect_action_start = (0, self.height * 0.25)
+        rect_action_end = (self.width, self.height)
+        button_minus, button_plus, _ = self._button_rects()
 
         self.draw.rectangle(
             [rect_title_start, rect_title_end],
@@ -237,80 +1516,582 @@ class VolumeControl:
             width=border,
         )
 
-        font_size = int(self.height * 0.15)
-        font_small_size = int(self.height * 0.09)
-        try:
-            font = ImageFont.truetype("arial.ttf", font_size)
-            font_small = ImageFont.truetype("arial.ttf", font_small_size)
-        except IOError:
-            font = ImageFont.load_default()
-            font_small = ImageFont.load_default()
+        font = FONTS.get(int(self.height * 0.15))
+        draw_in_box("-5", font, button_minus[0], button_minus[1], image)
+        draw_in_box("+5", font, button_plus[0], button_plus[1], image)
+
+    def draw_dynamic(self, image):
+        font = FONTS.get(int(self.height * 0.15))
+        font_small = FONTS.get(int(self.height * 0.09))
+        _, _, button_bottom = self._button_rects()
+        message_area_start = (10, button_bottom + 5)
+        message_area_end = (self.width - 10, self.height - 10)
 
         rect_start = (0, 0)
         rect_mid_end = (self.width, self.height * 0.25)
-        draw_in_box(f"volume {self.target_volume}%", font, rect_start, rect_mid_end, self.draw)
-        draw_in_box("-5", font, button_minus[0], button_minus[1], self.draw)
-        draw_in_box("+5", font, button_plus[0], button_plus[1], self.draw)
+        draw_in_box(f"volume {self.target_volume}%", font, rect_start, rect_mid_end, image)
 
-        if self.feedback_counter > 0 and self.last_message:
-            self.feedback_counter -= 1
+        if self.last_message and CLOCK.monotonic() < self.feedback_until:
             draw_in_box(
                 self.last_message,
                 font_small,
                 message_area_start,
                 message_area_end,
-                self.draw,
+                image,
             )
-            if self.feedback_counter == 0:
-                self.last_message = ""
+        else:
+            self.last_message = ""
+
+
+
+def parse_date(text):
+    return datetime.strptime(text, "%Y-%m-%d").date()
+
+
+def load_holidays(path):
+    """Dates from a holiday calendar: iCalendar DTSTART lines or one YYYY-MM-DD per line.
+
+    Only the listed dates count; iCalendar RRULEs are not expanded.
+    """
+    dates = set()
+    with open(path) as calendar:
+        for line in calendar:
+            if line.startswith("DTSTART") or line[:1].isdigit():
+                match = HOLIDAY_DATE.search(line)
+                if match:
+                    dates.add(date(*map(int, match.groups())))
+    return dates
+
+
+class ScheduleIndex:
+    """Sorted (fire time, alarm id) pairs for the next SCHEDULE_HORIZON_DAYS days.
+
+    Queries bisect into it. Editing an alarm only removes and re-inserts that
+    alarm's own entries, and the window moves a day at a time as days pass,
+    growing on demand when a query needs to look further ahead.
+    """
+
+    def __init__(self, store):
+        self.store = store
+        self.entries = []
+        self.by_alarm = {}
+        self.start = None
+        self.end = None
+
+    def clear(self):
+        self.entries = []
+        self.by_alarm = {}
+        self.start = self.end = None
+
+    def advance(self, today):
+        """Cover today (and yesterday, for the grace period) onwards."""
+        first = today - timedelta(days=1)
+        if self.start is None or first < self.start or first > self.end:
+            self.entries = []
+            self.by_alarm = {}
+            self.start = self.end = first
+        elif first > self.start:
+            cut = bisect_left(self.entries, (datetime(first.year, first.month, first.day), ""))
+            for _, alarm_id in self.entries[:cut]:
+                self.by_alarm[alarm_id].pop(0)
+            del self.entries[:cut]
+            self.start = first
+        self.extend(first + timedelta(days=SCHEDULE_HORIZON_DAYS))
+
+    def extend(self, end):
+        """Index the days from the current end of the window up to `end`."""
+        while self.end < end:
+            day_entries = []
+            for alarm in self.store.alarms:
+                fire_at = self.store.fire_time(alarm, self.end)
+                if fire_at is not None:
+                    day_entries.append((fire_at, alarm["id"]))
+            # Later days sort after everything already indexed.
+            for fire_at, alarm_id in sorted(day_entries):
+                self.entries.append((fire_at, alarm_id))
+                self.by_alarm.setdefault(alarm_id, []).append(fire_at)
+            self.end += timedelta(days=1)
+
+    def update(self, alarm_id):
+        """Re-index one alarm after it was added, changed or removed."""
+        for fire_at in self.by_alarm.pop(alarm_id, ()):
+            del self.entries[bisect_left(self.entries, (fire_at, alarm_id))]
+        alarm = self.store.alarm(alarm_id)
+        if alarm is None or self.start is None:
+            return
+        fire_times = []
+        day = self.start
+        while day < self.end:
+            fire_at = self.store.fire_time(alarm, day)
+            if fire_at is not None:
+                insort(self.entries, (fire_at, alarm_id))
+                fire_times.append(fire_at)
+            day += timedelta(days=1)
+        if fire_times:
+            self.by_alarm[alarm_id] = fire_times
+
+    def upcoming(self, count, after):
+        """The next `count` (fire time, alarm id) pairs strictly after `after`."""
+        self.advance(after.date())
+        limit = after.date() + timedelta(days=SCHEDULE_LOOKAHEAD_DAYS)
+        while True:
+            # chr(0x10ffff) sorts after every id, skipping entries at exactly `after`.
+            first = bisect_right(self.entries, (after, chr(0x10ffff)))
+            found = self.entries[first:first + count]
+            if len(found) == count or self.end >= limit:
+                return found
+            self.extend(min(limit, self.end + timedelta(days=SCHEDULE_HORIZON_DAYS)))
+
+
+class ScheduleStore:
+    """The alarm schedule shared by all screens.
+
+    Any number of alarms, each either recurring on a set of weekdays or a
+    one-off on a date, plus skip dates and holiday calendars. The seven
+    "day<N>" alarms back the per-weekday edit screen (`times`).
+
+    Edits apply in memory at once and are saved after SCHEDULE_WRITE_DELAY
+    seconds of quiet through a temporary file and an atomic rename. The file
+    is only parsed again when its mtime changes behind our back; every edit
+    checks that first, so a hand edit is merged rather than overwritten.
+    Without a schedule file the old per-weekday CSV is read and saved in the
+    new format.
+    """
+
+    def __init__(self, path=SCHEDULE_PATH, legacy_path=LEGACY_SCHEDULE_PATH):
+        self.path = path
+        self.legacy_path = legacy_path
+        self.alarms = []
+        self.by_id = {}
+        self.skip_dates = set()
+        self.holidays = set()
+        self.inline_holidays = set()
+        self.holiday_files = []
+        self.index = ScheduleIndex(self)
+        self.mtime = None
+        self.dirty = False
+        self.write_timer = None
+        self.lock = threading.Lock()
+        self.write_lock = threading.Lock()
+        self.unsaved = []  # edits since the last save, replayed onto external changes
+        self.listeners = []
+        self.load()
+        self.flush()
+
+    @property
+    def times(self):
+        """The weekday alarms, Monday first, as edited on the AlarmEdit screen."""
+        return [self.by_id[f"day{day}"] for day in range(7)]
+
+    def load(self):
+        """Read the schedule file, or the legacy CSV if there is none yet."""
+        if os.path.exists(self.path) or not os.path.exists(self.legacy_path):
+            mtime = os.stat(self.path).st_mtime
+            with open(self.path) as schedule_file:
+                data = json.load(schedule_file)
+            if data.get("version", 1) > SCHEDULE_VERSION:
+                raise ValueError(f"{self.path}: schedule version {data['version']} is newer than this clock")
+        else:
+            print(f"Converting {self.legacy_path} to {self.path}")
+            mtime = None
+            data = self.read_legacy()
+
+        # Parse everything before replacing anything, so a bad file leaves the old schedule.
+        alarms = [self.decode(alarm) for alarm in data.get("alarms", ())]
+        ids = {alarm["id"] for alarm in alarms}
+        for day in range(7):
+            if f"day{day}" not in ids:
+                alarms.append(self.decode({"id": f"day{day}", "days": [day], "hour": 6, "minute": 0, "enabled": 0}))
+        skip_dates = {parse_date(text) for text in data.get("skip_dates", ())}
+        holiday_files = list(data.get("holiday_files", ()))
+        inline_holidays = {parse_date(text) for text in data.get("holidays", ())}
+        holidays = set(inline_holidays)
+        for holiday_file in holiday_files:
+            holiday_path = os.path.join(os.path.dirname(self.path), holiday_file)
+            try:
+                holidays |= load_holidays(holiday_path)
+            except OSError as e:
+                print(f"Cannot read holidays from {holiday_path}: {e}")
+        with self.lock:
+            self.alarms = alarms
+            self.by_id = {alarm["id"]: alarm for alarm in alarms}
+            self.skip_dates = skip_dates
+            self.holiday_files = holiday_files
+            self.inline_holidays = inline_holidays
+            self.holidays = holidays
+            self.mtime = mtime
+            self.dirty = mtime is None
+        self.index.clear()
+
+    def read_legacy(self):
+        """The pre-version-1 format: 'day,hour,minute,enabled' CSV rows."""
+        alarms = []
+        with open(self.legacy_path, newline='') as csvfile:
+            time_reader = csv.reader(csvfile, delimiter=',', quotechar='|')
+            for row in time_reader:
+                if len(row) > 3:
+                    alarms.append({"id": f"day{int(row[0])}", "days": [int(row[0])], "hour": int(row[1]),
+                                   "minute": int(row[2]), "enabled": int(row[3])})
+        return {"version": SCHEDULE_VERSION, "alarms": alarms}
+
+    @staticmethod
+    def decode(entry):
+        alarm = dict(entry)
+        alarm["enabled"] = int(alarm.get("enabled", 1))
+        if "date" in alarm:
+            alarm["date"] = parse_date(alarm["date"])
+        else:
+            alarm["days"] = sorted(set(alarm.get("days", range(7))))
+        alarm["skip"] = {parse_date(text) for text in alarm.get("skip", ())}
+        alarm.setdefault("skip_holidays", False)
+        return alarm
+
+    @staticmethod
+    def encode(alarm):
+        entry = dict(alarm)
+        entry["enabled"] = bool(alarm["enabled"])
+        if "date" in alarm:
+            entry["date"] = alarm["date"].isoformat()
+        if alarm["skip"]:
+            entry["skip"] = sorted(day.isoformat() for day in alarm["skip"])
+        else:
+            del entry["skip"]
+        return entry
+
+    def alarm(self, alarm_id):
+        return self.by_id.get(alarm_id)
+
+    def fire_time(self, alarm, day):
+        """When `alarm` goes off on `day`, or None."""
+        if not alarm["enabled"] or day in self.skip_dates:
+            return None
+        if "date" in alarm:
+            if alarm["date"] != day:
+                return None
+        elif day.weekday() not in alarm["days"]:
+            return None
+        if day in alarm["skip"] or (alarm["skip_holidays"] and day in self.holidays):
+            return None
+        return datetime(day.year, day.month, day.day, alarm["hour"], alarm["minute"])
+
+    def upcoming(self, count, after):
+        """The next `count` (fire time, alarm) pairs after `after`."""
+        return [(fire_at, self.by_id[alarm_id]) for fire_at, alarm_id in self.index.upcoming(count, after)]
+
+    def reload_if_changed(self):
+        """Pick up external edits of the file; cheap when nothing changed.
+
+        Edits not saved yet are replayed onto the new contents, so neither
+        side is lost; an edit that no longer applies (its alarm was deleted
+        by hand, say) is dropped with a message.
+        """
+        try:
+            mtime = os.stat(self.path).st_mtime
+        except OSError:
+            return False
+        if mtime == self.mtime:
+            return False
+        # A save in progress changes the mtime itself; look again next time.
+        if not self.write_lock.acquire(blocking=False):
+            return False
+        try:
+            try:
+                self.load()
+            except (ValueError, KeyError, TypeError, OSError) as e:
+                # Keep the schedule in memory; the next save overwrites the bad file.
+                print(f"Cannot reload {self.path}, keeping the current schedule: {e}")
+                self.mtime = mtime
+                return False
+            unsaved, self.unsaved = self.unsaved, []
+            for edit in unsaved:
+                try:
+                    edit()
+                except (KeyError, ValueError) as e:
+                    print(f"Dropped an unsaved schedule edit that no longer applies: {e!r}")
+                else:
+                    self.unsaved.append(edit)
+        finally:
+            self.write_lock.release()
+        if self.unsaved:
+            self.changed()
+        else:
+            self.notify()
+        return True
 
+    def apply(self, edit):
+        """Run `edit` on the current schedule, reloading the file first, and schedule a save."""
+        self.reload_if_changed()
+        result = edit()
+        with self.lock:
+            self.unsaved.append(edit)
+        self.changed()
+        return result
+
+    def update(self, day, **fields):
+        """Change one weekday's alarm in memory and schedule a save."""
+        self.update_alarm(f"day{day}", **fields)
+
+    def update_alarm(self, alarm_id, **fields):
+        """Change any alarm's fields (hour, minute, enabled, days, date, skip, ...).
+
+        ValueError if the change would turn a recurring alarm into a one-off or
+        back, or move a weekday alarm off its own day.
+        """
+        def edit():
+            alarm = self.by_id[alarm_id]
+            if ("date" in fields and "days" in alarm) or ("days" in fields and "date" in alarm):
+                raise ValueError("recurring and one-off alarms cannot be converted")
+            weekday = WEEKDAY_ALARM_IDS.get(alarm_id)
+            if weekday is not None and "days" in fields and fields["days"] != [weekday]:
+                raise ValueError(f"{alarm_id} only rings on weekday {weekday}")
+            with self.lock:
+                alarm.update(fields)
+            self.index.update(alarm_id)
+        self.apply(edit)
+
+    def add(self, hour, minute, days=None, on=None, enabled=1, **fields):
+        """Add a recurring alarm on `days` (weekday numbers, default all) or a one-off `on` a date."""
+        alarm_id = fields.pop("id", None) or uuid.uuid4().hex[:8]
+
+        def edit():
+            if alarm_id in self.by_id:
+                raise ValueError(f"alarm {alarm_id!r} exists already")
+            alarm = {"id": alarm_id, "hour": hour, "minute": minute, "enabled": int(enabled)}
+            alarm.update(fields)
+            if on is not None:
+                alarm["date"] = on
+            else:
+                alarm["days"] = sorted(set(range(7) if days is None else days))
+            alarm.setdefault("skip", set())
+            alarm.setdefault("skip_holidays", False)
+            with self.lock:
+                self.alarms.append(alarm)
+                self.by_id[alarm_id] = alarm
+            self.index.update(alarm_id)
+        self.apply(edit)
+        return alarm_id
+
+    def remove(self, alarm_id):
+        """Delete an alarm; the weekday alarms can only be disabled."""
+        def edit():
+            if alarm_id in WEEKDAY_ALARM_IDS or alarm_id not in self.by_id:
+                raise KeyError(alarm_id)
+            with self.lock:
+                self.alarms.remove(self.by_id.pop(alarm_id))
+            self.index.update(alarm_id)
+        self.apply(edit)
+
+    def skip(self, day, skipped=True):
+        """Skip (or stop skipping) every alarm on a date."""
+        def edit():
+            with self.lock:
+                if skipped:
+                    self.skip_dates.add(day)
+                else:
+                    self.skip_dates.discard(day)
+            self.index.clear()
+        self.apply(edit)
+
+    def changed(self):
+        with self.lock:
+            self.dirty = True
+            if self.write_timer is not None:
+                self.write_timer.cancel()
+            self.write_timer = CLOCK.timer(SCHEDULE_WRITE_DELAY, self.flush)
+            self.write_timer.start()
+        self.notify()
+
+    def flush(self):
+        """Write pending edits to disk atomically; safe to call from any thread.
+
+        Edits take `lock` too, so the snapshot taken under it is consistent;
+        the slow write happens outside it and never holds up an edit. A file
+        edited behind our back is left alone until reload_if_changed() has
+        merged it, which also schedules the save again.
+        """
+        with self.write_lock:
+            if self.mtime is not None:
+                try:
+                    changed_on_disk = os.stat(self.path).st_mtime != self.mtime
+                except OSError:
+                    changed_on_disk = False
+                if changed_on_disk:
+                    print(f"{self.path} changed on disk; saving after it is merged")
+                    return
+            with self.lock:
+                if not self.dirty:
+                    return
+                if self.write_timer is not None:
+                    self.write_timer.cancel()
+                    self.write_timer = None
+                data = {
+                    "version": SCHEDULE_VERSION,
+                    "alarms": [self.encode(alarm) for alarm in self.alarms],
+                    "skip_dates": sorted(day.isoformat() for day in self.skip_dates),
+                    "holiday_files": list(self.holiday_files),
+                }
+                if self.inline_holidays:
+                    data["holidays"] = sorted(day.isoformat() for day in self.inline_holidays)
+                saved = len(self.unsaved)
+                self.dirty = False
+            try:
+                temp_path = self.path + ".tmp"
+                with open(temp_path, 'w') as schedule_file:
+                    json.dump(data, schedule_file, indent=2)
+                    schedule_file.write("\n")
+                    schedule_file.flush()
+                    os.fsync(schedule_file.fileno())
+                os.replace(temp_path, self.path)
+            except OSError as e:
+                # Runs on a timer or executor thread nobody awaits; log and try again later.
+                print(f"Cannot save {self.path}, retrying in {SCHEDULE_WRITE_DELAY} s: {e}")
+                with self.lock:
+                    self.dirty = True
+                    if self.write_timer is None:
+                        self.write_timer = CLOCK.timer(SCHEDULE_WRITE_DELAY, self.flush)
+                        self.write_timer.start()
+                return
+            self.mtime = os.stat(self.path).st_mtime
+            with self.lock:
+                del self.unsaved[:saved]
+
+    def notify(self):
+        for listener in self.listeners:
+            listener()
+
+
+# Alarm playback states
+ALARM_IDLE = "idle"
+ALARM_CONNECTING = "connecting"
+ALARM_PLAYING = "playing"
+ALARM_FALLBACK = "fallback"
+
+
+class AlarmScheduler:
+    """Compute absolute alarm fire times and sleep until the next one.
+
+    The wait runs on the monotonic clock. It is recomputed when the schedule
+    changes (notify_changed) or when the wall clock steps (NTP sync, DST),
+    which is detected by the offset between wall and monotonic time moving.
+    """
+
+    def __init__(self, schedule):
+        self.schedule = schedule
+        self.changed = asyncio.Event()
+        self.loop = None
+        self.last_fired = None
+        self.prerolled = None
+        self.wakeup_listener = None  # called with "clock_check" on each wall clock step check
+        self.fire_delay = METRICS.histogram(
+            "clock_alarm_fire_delay_seconds", "Alarm firing time minus its scheduled time.", DELAY_BUCKETS)
+
+    def upcoming(self, count=1, after=None):
+        """Return the next `count` (fire time, alarm) pairs after `after`; times are local naive datetimes."""
+        return self.schedule.upcoming(count, after or CLOCK.now())
+
+    def alarms_at(self, fire_at):
+        """The alarms due at `fire_at`."""
+        return [alarm for at, alarm in self.upcoming(8, fire_at - timedelta(seconds=1)) if at == fire_at]
+
+    def notify_changed(self):
+        """Recompute the pending deadline; safe to call from any thread."""
+        if self.loop is None:
+            return
+        self.loop.call_soon_threadsafe(self.changed.set)
+
+    def next_fire_time(self):
+        after = CLOCK.now() - timedelta(seconds=ALARM_GRACE)
+        if self.last_fired is not None and self.last_fired > after:
+            after = self.last_fired
+        fire_times = self.upcoming(1, after)
+        return fire_times[0][0] if fire_times else None
+
+    async def run(self, on_fire, on_preroll=None, on_cancel=None):
+        """Call on_fire(fire_at) at every scheduled alarm time.
+
+        With ALARM_PREROLL set, on_preroll(fire_at) is called that many seconds
+        earlier, and on_cancel() if that alarm is then edited away.
+        """
+        self.loop = asyncio.get_running_loop()
+        while True:
+            self.changed.clear()
+            fire_at = self.next_fire_time()
+            if self.prerolled is not None and self.prerolled != fire_at:
+                self.prerolled = None
+                if on_cancel is not None:
+                    on_cancel()
+            if fire_at is None:
+                await self.changed.wait()
+                continue
+
+            # timestamp() on a naive datetime honours the local DST rules.
+            wall_offset = CLOCK.time() - CLOCK.monotonic()
+            deadline = CLOCK.monotonic() + fire_at.timestamp() - CLOCK.time()
+            if on_preroll is not None and ALARM_PREROLL > 0 and self.prerolled != fire_at:
+                if not await self.wait_until(deadline - ALARM_PREROLL, wall_offset):
+                    continue
+                self.prerolled = fire_at
+                on_preroll(fire_at)
+            if await self.wait_until(deadline, wall_offset):
+                self.last_fired = fire_at
+                self.prerolled = None
+                self.fire_delay.observe(CLOCK.time() - fire_at.timestamp())
+                on_fire(fire_at)
+
+    async def wait_until(self, deadline, wall_offset):
+        """Sleep until the deadline; return False if it must be recomputed."""
+        while True:
+            remaining = deadline - CLOCK.monotonic()
+            if remaining <= 0:
+                return True
+            try:
+                await asyncio.wait_for(self.changed.wait(), min(remaining, CLOCK_STEP_CHECK_INTERVAL))
+                return False
+            except asyncio.TimeoutError:
+                pass
+            if deadline > CLOCK.monotonic() and self.wakeup_listener is not None:
+                self.wakeup_listener("clock_check")
+            if abs(CLOCK.time() - CLOCK.monotonic() - wall_offset) > CLOCK_STEP_TOLERANCE:
+                return False
 
 
 class Alarm:
     """Handle alarm functionality and UI."""
 
-    def __init__(self, width, height):
+    def __init__(self, width, height, audio, connectivity, music, schedule, stations, stream_cache):
         self.width = width
         self.height = height
         self.cursor_v_index = 0
         self.cursor_h_index = 0
-        self.alarm_times = self.read_times()
-
-        self.url = 'https://ice.actve.net/fm-evropa2-128'
-        self.instance = vlc.Instance()
-        self.player = self.instance.media_player_new()
-        self.media = self.instance.media_new(self.url)
-        self.player.set_media(self.media)
-
-        self.alarm_ringing = 0
-        self.alarm_time = 0
-        self.backup_alarm = False
-        self.internet_status = True
+        self.schedule = schedule
+        self.scheduler = AlarmScheduler(schedule)
+        schedule.listeners.append(self.scheduler.notify_changed)
+
+        self.stations = stations
+        self.url = None
+        self.audio = audio.session("alarm", PRIORITY_ALARM)
+        self.audio.listener = self._on_vlc_event
+
+        self.state = ALARM_IDLE
+        self.prerolling = False
+        self.was_ringing = False
+        self.ringing_listener = None
+        self.ring_started = 0
+        self.loop = None
+        self.timers = {}
+        self.stream_started = None
+        self.stream_start = METRICS.histogram(
+            "clock_stream_start_seconds", "Alarm stream play() to first Playing event.", DELAY_BUCKETS)
+        self.fallbacks = METRICS.counter(
+            "clock_alarm_fallbacks_total", "Switches from the stream to a local file (or a retry).")
+        self.connectivity = connectivity
+        connectivity.listeners.append(self.connectivity_changed)
+        self.music = music
+        self.stream_cache = stream_cache
+        self.cached = None  # recorded segments still to play in this alarm
 
     def is_alarm_ringing(self):
-        return self.alarm_ringing > 0
-
-    def read_times(self):
-        """Read alarm times from CSV file."""
-        times = [{} for _ in range(7)]
-
-        with open('/home/pi/alarmclock.csv', newline='') as csvfile:
-            time_reader = csv.reader(csvfile, delimiter=',', quotechar='|')
-            for row in time_reader:
-                if len(row) > 2:
-                    day_idx = int(row[0])
-                    times[day_idx] = {
-                        "hour": int(row[1]),
-                        "minute": int(row[2]),
-                        "enabled": int(row[3])
-                    }
-                    times[day_idx]["seconds_from_midnight"] = (
-                        times[day_idx]["hour"] * 3600 + times[day_idx]["minute"] * 60
-                    )
-        return times
-
-    def refresh_alarm(self):
-        self.alarm_times = self.read_times()
+        return self.state != ALARM_IDLE and not self.prerolling
 
     def set_v_cursor(self, cursor_offset):
         self.cursor_v_index += cursor_offset
@@ -321,86 +2102,164 @@ class Alarm:
         self.cursor_h_index += cursor_offset
         self.cursor_h_index %= 2
 
-    def cdraw(self, image):
-        self.draw_top_menu(image)
+    def static_key(self):
+        return self.cursor_v_index, self.connectivity.online
+
+    def redraw_in(self):
+        """Seconds until the clock face shows the next minute."""
+        now = CLOCK.now()
+        return 60 - now.second - now.microsecond / 1e6
 
     def get_next_alarm(self):
-        """Find the next scheduled alarm."""
-        now = datetime.now()
-        current_seconds = now.hour * 3600 + now.minute * 60 + now.second
-
-        for day_offset in range(7):
-            current_day = (datetime.today().weekday() + day_offset) % 7
-            alarm_data = self.alarm_times[current_day]
-
-            if alarm_data["enabled"] == 1 and (
-                day_offset > 0 or
-                alarm_data["seconds_from_midnight"] > current_seconds
-            ):
-                return current_day, alarm_data
-        return None, None
-
-    def check_alarm(self):
-        """Check if alarm should be triggered and manage alarm state."""
-        now = datetime.now()
-        current_day = now.weekday()
-        current_seconds = now.hour * 3600 + now.minute * 60 + now.second
-
-        # Check if we need to start alarm
-        if not self.alarm_ringing:
-            if (self.alarm_times[current_day]["enabled"] == 1 and
-                abs(self.alarm_times[current_day]["seconds_from_midnight"] - current_seconds) < 30):
-                self.player.play()
-                self.alarm_ringing = 1
-                self.alarm_time = self.alarm_times[current_day]["seconds_from_midnight"]
-                self.backup_alarm = False
-
-                # Wait for playback to start
-                for _ in range(60):
-                    sleep(3)
-                    if self.player.is_playing():
-                        print("playing")
-                        break
+        """The next (fire time, alarm), or (None, None)."""
+        fire_times = self.scheduler.upcoming(1)
+        return fire_times[0] if fire_times else (None, None)
+
+    def station_url(self, fire_at=None):
+        """Stream URL of the station chosen by the alarm(s) firing at `fire_at`."""
+        station_id = None
+        if fire_at is not None:
+            for alarm in self.scheduler.alarms_at(fire_at):
+                station_id = station_id or alarm.get("station")
+        self.connectivity.refresh_if_stale()
+        return self.stations.stream_url(self.stations.get(station_id), self.connectivity.poor)
+
+    def preroll_alarm(self, fire_at=None):
+        """Open and buffer the stream muted so the alarm only has to unmute."""
+        if self.state != ALARM_IDLE:
+            return
+        if self.audio.engine.owner not in (None, self.audio):
+            # The radio is playing, so audio is already flowing; start normally.
+            return
+        self.loop = asyncio.get_running_loop()
+        self.url = self.station_url(fire_at)
+        self.prerolling = True
+        self.audio.set_muted(True)
+        self.play_stream()
+
+    def cancel_preroll(self):
+        if self.prerolling:
+            self.stop_playback()
+
+    def start_alarm(self, fire_at=None):
+        """Start ringing; playback is then supervised by libvlc events."""
+        if self.is_alarm_ringing():
+            return
+        self.loop = asyncio.get_running_loop()
+        self.ring_started = CLOCK.monotonic()
+        if self.prerolling:
+            # Whatever the pre-roll reached (buffered stream or fallback) goes on air.
+            self.prerolling = False
+            self.audio.set_muted(False)
+            self.notify_ringing()
         else:
-            # Manage running alarm
-            print("check player")
-            self.alarm_ringing += 1
-
-            working_ok = self.player.is_playing() and internet_connection()
-            if not working_ok and not self.backup_alarm:
-                print("backup")
-                # Fall back to local files if streaming fails
-                cwd = "/home/pi/Music"
-                music_files = [os.path.join(cwd, f) for f in os.listdir(cwd)
-                              if os.path.isfile(os.path.join(cwd, f))]
-
-                if music_files:
-                    self.player.stop()
-                    self.media = self.instance.media_new(random.choice(music_files))
-                    self.player.set_media(self.media)
-                    self.player.play()
-                    self.backup_alarm = True
-
-            if self.backup_alarm and not self.player.is_playing():
-                self.backup_alarm = False
-
-            # Stop alarm after 20 minutes
-            if abs(self.alarm_time - current_seconds) > 1200:  # 20 minutes in seconds
-                self.player.stop()
-                self.alarm_ringing = 0
+            self.url = self.station_url(fire_at)
+            self.play_stream()
+        self.arm_timer("duration", ALARM_DURATION, self.reset_alarm)
 
     def reset_alarm(self):
         """Stop the alarm if it's ringing."""
-        self.player.stop()
-        self.alarm_ringing = 0
+        if not self.prerolling:
+            self.stop_playback()
+
+    def stop_playback(self):
+        for handle in self.timers.values():
+            handle.cancel()
+        self.timers.clear()
+        self.prerolling = False
+        self.audio.stop()
+        self.audio.set_muted(False)
+        self.cached = None
+        self.set_state(ALARM_IDLE)
+
+    def set_state(self, state):
+        self.state = state
+        self.notify_ringing()
+
+    def notify_ringing(self):
+        ringing = self.is_alarm_ringing()
+        if ringing != self.was_ringing:
+            self.was_ringing = ringing
+            if self.ringing_listener is not None:
+                self.ringing_listener(ringing)
+
+    def arm_timer(self, name, delay, callback):
+        self.cancel_timer(name)
+        self.timers[name] = self.loop.call_later(delay, callback)
+
+    def cancel_timer(self, name):
+        handle = self.timers.pop(name, None)
+        if handle is not None:
+            handle.cancel()
+
+    def play_stream(self):
+        self.cancel_timer("retry")
+        self.stream_started = CLOCK.monotonic()
+        self.audio.play(self.url)
+        self.set_state(ALARM_CONNECTING)
+        self.arm_timer("connect", ALARM_CONNECT_TIMEOUT, self.fall_back)
+
+    def fall_back(self):
+        """Switch to the recorded stream, then random local files, or retry the stream if there are none."""
+        print("backup")
+        self.fallbacks.inc()
+        self.cancel_timer("connect")
+        self.cancel_timer("stall")
+        if self.cached is None:
+            self.cached = deque(self.stream_cache.segments())
+        track = self.cached.popleft() if self.cached else self.music.next_track()
+        if track is None:
+            self.audio.stop()
+            self.arm_timer("retry", ALARM_RETRY_DELAY, self.play_stream)
+            return
+        self.audio.play(track)
+        self.set_state(ALARM_FALLBACK)
+
+    def connectivity_changed(self, online):
+        if not online and self.state in (ALARM_CONNECTING, ALARM_PLAYING):
+            self.fall_back()
 
-    def draw_top_menu(self, image):
+    def _on_vlc_event(self, event):
+        """libvlc callback; runs on a libvlc thread, so only hand the event over."""
+        if self.loop is None:
+            return
+        cache = None
+        if event.type == vlc.EventType.MediaPlayerBuffering:
+            cache = event.u.new_cache
+        self.loop.call_soon_threadsafe(self.on_player_event, event.type, cache)
+
+    def on_player_event(self, event_type, cache):
+        """Advance the playback state machine on the event loop thread."""
+        if self.state == ALARM_IDLE:
+            return
+        if event_type == vlc.EventType.MediaPlayerPlaying:
+            self.cancel_timer("connect")
+            self.cancel_timer("stall")
+            if self.prerolling:
+                # Mute set before the audio output existed may not have stuck.
+                self.audio.set_muted(True)
+            if self.state == ALARM_CONNECTING:
+                print("playing")
+                self.stream_start.observe(CLOCK.monotonic() - self.stream_started)
+                self.set_state(ALARM_PLAYING)
+        elif event_type == vlc.EventType.MediaPlayerBuffering:
+            if self.state == ALARM_PLAYING:
+                if cache < 100:
+                    if "stall" not in self.timers:
+                        self.arm_timer("stall", ALARM_STALL_TIMEOUT, self.fall_back)
+                else:
+                    self.cancel_timer("stall")
+        elif event_type in (vlc.EventType.MediaPlayerEncounteredError,
+                            vlc.EventType.MediaPlayerEndReached):
+            # Error or end of stream/track: go (on) to a local file at once.
+            self.fall_back()
+
+    def draw_static(self, image):
         self.draw = ImageDraw.Draw(image)
         border = 2
         rect_start = (0, 0)
         rect_mid_end = (self.width, self.height * 0.25)
         rect_mid_start = (0, self.height * 0.25)
-        rect_text_end = (self.width, self.height - self.height * 0.25)
         rect_end = (self.width, self.height)
 
         if self.cursor_v_index == 0:
@@ -410,42 +2269,41 @@ class Alarm:
             self.draw.rectangle([rect_start, rect_mid_end], outline='white', width=border)
             self.draw.rectangle([rect_mid_start, rect_end], fill='green', outline='white', width=border)
 
-        draw_wifi_status(self.draw, self.internet_status)
+        draw_wifi_status(self.draw, self.connectivity.online)
+
+        font = FONTS.get(int(self.height * 0.15))
+        draw_in_box("budzik", font, rect_start, rect_mid_end, image)
+
+    def draw_dynamic(self, image):
+        rect_mid_start = (0, self.height * 0.25)
+        rect_text_end = (self.width, self.height - self.height * 0.25)
+        rect_end = (self.width, self.height)
 
         # Setup fonts
         font_size = int(self.height * 0.15)
-        try:
-            font = ImageFont.truetype("arial.ttf", font_size)
-            font_large = ImageFont.truetype("arial.ttf", int(font_size * 2))
-            font_smaller = ImageFont.truetype("arial.ttf", int(font_size * 0.75))
-        except IOError:
-            font = ImageFont.load_default()
-            font_large = ImageFont.load_default()
-            font_smaller = ImageFont.load_default()
-
-        # Draw UI elements
-        draw_in_box("budzik", font, rect_start, rect_mid_end, self.draw)
+        font_large = FONTS.get(int(font_size * 2))
+        font_smaller = FONTS.get(int(font_size * 0.75))
 
-        time_text = datetime.now().strftime('%H:%M')
-        draw_in_box(time_text, font_large, rect_mid_start, rect_text_end, self.draw)
+        time_text = CLOCK.now().strftime('%H:%M')
+        draw_in_box(time_text, font_large, rect_mid_start, rect_text_end, image)
 
-        _, _, _, text_height = self.draw.textbbox((0, 0), time_text, font=font_large)
+        text_height = TEXT_SPRITES.get(time_text, font_large).size[1]
 
         if not self.is_alarm_ringing():
-            next_alarm_day, next_alarm = self.get_next_alarm()
+            next_fire, next_alarm = self.get_next_alarm()
             if next_alarm:
-                alarm_text = f"{DAY_TO_STRING[next_alarm_day]}  {next_alarm['hour']:02d}:{next_alarm['minute']:02d}"
+                alarm_text = f"{DAY_TO_STRING[next_fire.weekday()]}  {next_fire:%H:%M}"
                 draw_in_box(alarm_text, font_smaller,
-                           (0, self.height * 0.5 + text_height), rect_end, self.draw)
+                           (0, self.height * 0.5 + text_height), rect_end, image)
         else:
             draw_in_box("STOVAC", font_smaller,
-                      (0, self.height * 0.5 + text_height), rect_end, self.draw, color='red')
+                      (0, self.height * 0.5 + text_height), rect_end, image, color='red')
 
 
 class AlarmEdit:
     """Handle alarm settings editing."""
 
-    def __init__(self, width, height):
+    def __init__(self, width, height, schedule):
         self.width = width
         self.height = height
         self.cursor_v_index = 0
@@ -453,48 +2311,29 @@ class AlarmEdit:
         self.day_index = 0
         self.time_index = 0
         self.enabled_index = 0
-        self.alarm_times = self.read_times()
+        self.schedule = schedule
 
-    def read_times(self):
-        """Read alarm times from CSV file."""
-        times = [{} for _ in range(7)]
-
-        with open('/home/pi/alarmclock.csv', newline='') as csvfile:
-            time_reader = csv.reader(csvfile, delimiter=',', quotechar='|')
-            for row in time_reader:
-                if len(row) > 2:
-                    times[int(row[0])] = {
-                        "hour": int(row[1]),
-                        "minute": int(row[2]),
-                        "enabled": int(row[3])
-                    }
-        return times
-
-    def write_times(self):
-        """Write alarm times to CSV file."""
-        with open('/home/pi/alarmclock.csv', 'w', newline='') as csvfile:
-            time_writer = csv.writer(csvfile, delimiter=',', quotechar='|', quoting=csv.QUOTE_MINIMAL)
-            for day in range(7):
-                time_writer.writerow([
-                    day,
-                    self.alarm_times[day]["hour"],
-                    self.alarm_times[day]["minute"],
-                    self.alarm_times[day]["enabled"]
-                ])
+    @property
+    def alarm_times(self):
+        return self.schedule.times
 
     def set_v_cursor(self, cursor_offset):
         if self.cursor_v_index == 2 and self.time_index != 0:
+            entry = self.alarm_times[self.day_index]
             if self.time_index == 2:
-                self.alarm_times[self.day_index]["minute"] -= cursor_offset * 5
-                self.alarm_times[self.day_index]["minute"] %= 60
+                self.schedule.update(self.day_index, minute=(entry["minute"] - cursor_offset * 5) % 60)
             elif self.time_index == 1:
-                self.alarm_times[self.day_index]["hour"] -= cursor_offset
-                self.alarm_times[self.day_index]["hour"] %= 24
-            self.write_times()
+                self.schedule.update(self.day_index, hour=(entry["hour"] - cursor_offset) % 24)
         else:
             self.cursor_v_index += cursor_offset
             self.cursor_v_index %= 4
 
+    def repeats(self, label):
+        """Hour/minute (A/B) and day (X/Y) changes repeat while held."""
+        if label in ("A", "B"):
+            return self.cursor_v_index == 2 and self.time_index != 0
+        return self.cursor_v_index == 1
+
     def set_h_cursor(self, cursor_offset):
         if self.cursor_v_index == 1:
             self.day_index += cursor_offset
@@ -503,34 +2342,40 @@ class AlarmEdit:
             self.time_index += cursor_offset
             self.time_index %= 3
         elif self.cursor_v_index == 3:
-            self.alarm_times[self.day_index]["enabled"] += cursor_offset
-            self.alarm_times[self.day_index]["enabled"] %= 2
-            self.write_times()
+            enabled = (self.alarm_times[self.day_index]["enabled"] + cursor_offset) % 2
+            self.schedule.update(self.day_index, enabled=enabled)
         else:
             self.cursor_h_index += cursor_offset
             self.cursor_h_index %= 2
 
-    def cdraw(self, image):
-        self.draw_top_menu(image)
+    def static_key(self):
+        time_index = self.time_index % 3 if self.cursor_v_index == 2 else None
+        return self.cursor_v_index, time_index, bool(self.alarm_times[self.day_index]["enabled"])
+
+    def redraw_in(self):
+        return None
+
+    def _regions(self):
+        rect_day = [(0, self.height * 0.25), (self.width, self.height * 0.5)]
+        time_button1 = [(0 + 10, self.height * 0.5 + 10),
+                        (self.width * 0.5 - 10, self.height * 0.75 - 10)]
+        time_button2 = [(self.width * 0.5 + 10, self.height * 0.5 + 10),
+                        (self.width - 10, self.height * 0.75 - 10)]
+        return rect_day, time_button1, time_button2
 
-    def draw_top_menu(self, image):
+    def draw_static(self, image):
         self.draw = ImageDraw.Draw(image)
         border = 2
 
         # Define UI regions
         rect_title_start = (0, 0)
         rect_title_end = (self.width, self.height * 0.25)
-        rect_day_start = (0, self.height * 0.25)
-        rect_day_end = (self.width, self.height * 0.5)
         rect_time_start = (0, self.height * 0.5)
         rect_time_end = (self.width, self.height * 0.75)
         rect_enabled_start = (0, self.height * 0.75)
         rect_enabled_end = (self.width, self.height)
 
-        time_button1 = [(0 + 10, self.height * 0.5 + 10),
-                        (self.width * 0.5 - 10, self.height * 0.75 - 10)]
-        time_button2 = [(self.width * 0.5 + 10, self.height * 0.5 + 10),
-                        (self.width - 10, self.height * 0.75 - 10)]
+        rect_day, time_button1, time_button2 = self._regions()
         enabled_button = [(0 + 10, self.height * 0.75 + 10),
                           (self.width - 10, self.height - 10)]
 
@@ -538,7 +2383,7 @@ class AlarmEdit:
         self.draw.rectangle([rect_title_start, rect_title_end],
                            fill='green' if self.cursor_v_index == 0 else None,
                            outline='white', width=border)
-        self.draw.rectangle([rect_day_start, rect_day_end],
+        self.draw.rectangle([rect_day[0], rect_day[1]],
                            fill='green' if self.cursor_v_index == 1 else None,
                            outline='white', width=border)
 
@@ -566,139 +2411,481 @@ class AlarmEdit:
 
         # Setup fonts
         font_size = int(self.height * 0.15)
-        try:
-            font = ImageFont.truetype("arial.ttf", font_size)
-            font_smaller = ImageFont.truetype("arial.ttf", int(font_size * 0.75))
-        except IOError:
-            font = ImageFont.load_default()
-            font_smaller = ImageFont.load_default()
+        font = FONTS.get(font_size)
+        font_smaller = FONTS.get(int(font_size * 0.75))
 
         # Draw text elements
-        draw_in_box("nastaveni", font, rect_title_start, rect_title_end, self.draw)
-        draw_in_box(DAY_TO_STRING[self.day_index], font_smaller, rect_day_start, rect_day_end, self.draw)
-        draw_in_box(":", font_smaller, rect_time_start, rect_time_end, self.draw)
+        draw_in_box("nastaveni", font, rect_title_start, rect_title_end, image)
+        draw_in_box(":", font_smaller, rect_time_start, rect_time_end, image)
+        draw_in_box("on" if self.alarm_times[self.day_index]["enabled"] else "off",
+                   font_smaller, enabled_button[0], enabled_button[1], image)
+
+    def draw_dynamic(self, image):
+        font_smaller = FONTS.get(int(int(self.height * 0.15) * 0.75))
+        rect_day, time_button1, time_button2 = self._regions()
+
+        draw_in_box(DAY_TO_STRING[self.day_index], font_smaller, rect_day[0], rect_day[1], image)
         draw_in_box(str(self.alarm_times[self.day_index]["hour"]), font_smaller,
-                   time_button1[0], time_button1[1], self.draw)
+                   time_button1[0], time_button1[1], image)
         draw_in_box(str(self.alarm_times[self.day_index]["minute"]), font_smaller,
-                   time_button2[0], time_button2[1], self.draw)
-        draw_in_box("on" if self.alarm_times[self.day_index]["enabled"] else "off",
-                   font_smaller, enabled_button[0], enabled_button[1], self.draw)
+                   time_button2[0], time_button2[1], image)
+
+
+class Frame:
+    """A preallocated RGB565 frame that screens draw their dynamic layer onto.
+
+    It stands in for the PIL image passed to draw_dynamic: paste() looks up
+    the text block pre-blended onto the current static layer and copies it
+    in, so dynamic text must not overlap other dynamic text.
+    """
+
+    def __init__(self, width, height):
+        self.pixels = np.zeros((height, width), dtype=">u2")
+        self.layer = None
+
+    def begin(self, layer):
+        """Start a new frame from a static layer."""
+        self.layer = layer
+        np.copyto(self.pixels, layer.pixels)
+
+    def paste(self, sprite, pos, mask=None):
+        box, block = TEXT_BLOCKS.get(self.layer, sprite, pos)
+        if block is not None:
+            x0, y0, x1, y1 = box
+            self.pixels[y0:y1, x0:x1] = block
+
+
+class Renderer:
+    """Push only the changed parts of each RGB565 frame to the display."""
+
+    def __init__(self, disp, width, height):
+        self.disp = disp
+        self.width = width
+        self.height = height
+        self.last_frame = np.zeros((height, width), dtype=">u2")
+        self.has_last_frame = False
+        self.transfer = np.zeros(width * height, dtype=">u2")
+        self.frames_sent = 0
+        self.frames_skipped = 0
+        self.bytes_sent = 0
+        # Windowed writes need the pimoroni driver internals; other drivers
+        # get a PIL image converted back from the frame, sent in full.
+        self.windowed = all(hasattr(disp, name) for name in ("set_window", "data"))
+        self.rotation = getattr(disp, "_rotation", 0)
+        self.present = getattr(disp, "present", None)  # frame boundary hook (simulator)
+        self.transfer_seconds = METRICS.histogram(
+            "clock_frame_transfer_seconds", "Time spent pushing a frame's dirty windows to the display.")
+        METRICS.reading("counter", "clock_frames_total", "Frames handed to the renderer.",
+                        lambda: self.frames_sent, result="sent")
+        METRICS.reading("counter", "clock_frames_total", "Frames handed to the renderer.",
+                        lambda: self.frames_skipped, result="unchanged")
+        METRICS.reading("counter", "clock_display_bytes_total", "Pixel bytes written to the display.",
+                        lambda: self.bytes_sent)
+
+    def show(self, pixels):
+        """Send the frame, or the damaged regions of it, to the display."""
+        full = (0, 0, self.width, self.height)
+        if not self.has_last_frame:
+            rects = [full]
+        else:
+            rects = self.dirty_rects(pixels)
+            if not rects:
+                self.frames_skipped += 1
+                return
+
+        started = perf_counter()
+        dirty_area = sum((x1 - x0) * (y1 - y0) for x0, y0, x1, y1 in rects)
+        if not self.windowed:
+            self.disp.display(self.to_image(pixels))
+            self.bytes_sent += self.width * self.height * 2
+        elif dirty_area > FULL_FRAME_RATIO * self.width * self.height:
+            self.write_rect(pixels, full)
+        else:
+            for rect in rects:
+                self.write_rect(pixels, rect)
+        self.transfer_seconds.observe(perf_counter() - started)
+
+        np.copyto(self.last_frame, pixels)
+        self.has_last_frame = True
+        self.frames_sent += 1
+        if self.present is not None:
+            self.present()
+
+    def dirty_rects(self, pixels):
+        """Return bounding rectangles of the changed bands, merged where adjacent."""
+        diff = pixels != self.last_frame
+        rows = np.flatnonzero(diff.any(axis=1))
+        if rows.size == 0:
+            return []
+
+        rects = []
+        for band_top in range(rows[0], rows[-1] + 1, DIRTY_BAND_HEIGHT):
+            band = diff[band_top:band_top + DIRTY_BAND_HEIGHT]
+            band_rows = np.flatnonzero(band.any(axis=1))
+            if band_rows.size == 0:
+                continue
+            band_cols = np.flatnonzero(band.any(axis=0))
+            x0, y0, x1, y1 = (int(band_cols[0]), int(band_top + band_rows[0]),
+                              int(band_cols[-1]) + 1, int(band_top + band_rows[-1]) + 1)
+            if rects and rects[-1][3] == band_top:
+                px0, py0, px1, _ = rects[-1]
+                rects[-1] = (min(px0, x0), py0, max(px1, x1), y1)
+            else:
+                rects.append((x0, y0, x1, y1))
+        return rects
+
+    def write_rect(self, pixels, rect):
+        """Send one rectangle of the frame through a windowed write.
+
+        The rotated window is copied into the preallocated transfer buffer
+        and handed to the driver as a byte view, without allocating.
+        """
+        x0, y0, x1, y1 = rect
+        block = np.rot90(pixels[y0:y1, x0:x1], (self.rotation // 90) % 4)
+        out = self.transfer[:block.size].reshape(block.shape)
+        np.copyto(out, block)
+
+        x0, y0, x1, y1 = self.rotate_rect(rect)
+        self.disp.set_window(x0, y0, x1 - 1, y1 - 1)
+        self.disp.data(memoryview(out).cast("B"))
+        self.bytes_sent += out.nbytes
+
+    @staticmethod
+    def to_image(pixels):
+        """Expand an RGB565 frame back to a PIL image for drivers without windowed writes."""
+        rgb = np.empty(pixels.shape + (3,), dtype=np.uint8)
+        rgb[..., 0] = (pixels >> 8) & 0xF8
+        rgb[..., 1] = (pixels >> 3) & 0xFC
+        rgb[..., 2] = (pixels << 3) & 0xF8
+        return Image.fromarray(rgb, "RGB")
+
+    def rotate_rect(self, rect):
+        """Map an image rectangle to panel coordinates (the driver uses np.rot90)."""
+        x0, y0, x1, y1 = rect
+        w, h = self.width, self.height
+        turns = (self.rotation // 90) % 4
+        if turns == 1:
+            return y0, w - x1, y1, w - x0
+        if turns == 2:
+            return w - x1, h - y1, w - x0, h - y0
+        if turns == 3:
+            return h - y1, x0, h - y0, x1
+        return rect
+
+
+class DisplayThread:
+    """Transfer composed frames to the display on a background thread.
+
+    The producer composes into `back` and calls submit(), which swaps it
+    with the pending slot. The transfer thread always takes the newest
+    pending frame, so a frame replaced before it was taken is dropped and
+    input never waits for an SPI transfer to finish. A failed transfer is
+    logged and the frame is sent again in full after DISPLAY_RETRY_DELAY,
+    unless a newer one has arrived by then.
+    """
+
+    def __init__(self, renderer, width, height):
+        self.renderer = renderer
+        self.back = Frame(width, height)
+        self.pending = Frame(width, height)
+        self.sending = Frame(width, height)
+        self.has_pending = False
+        self.busy = False
+        self.frames_dropped = 0
+        METRICS.reading("counter", "clock_frames_total", "Frames handed to the renderer.",
+                        lambda: self.frames_dropped, result="dropped")
+        self.errors = METRICS.counter("clock_display_errors_total", "Frame transfers that failed.")
+        self.cond = threading.Condition()
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def submit(self):
+        """Hand the composed back buffer over for transfer."""
+        with self.cond:
+            if self.has_pending:
+                self.frames_dropped += 1
+            self.back, self.pending = self.pending, self.back
+            self.has_pending = True
+            self.cond.notify_all()
+
+    def wait_idle(self, timeout=None):
+        """Block until every submitted frame has been sent (or dropped)."""
+        with self.cond:
+            return self.cond.wait_for(lambda: not self.has_pending and not self.busy, timeout)
+
+    def _run(self):
+        while True:
+            with self.cond:
+                while not self.has_pending:
+                    self.cond.wait()
+                self.pending, self.sending = self.sending, self.pending
+                self.has_pending = False
+                self.busy = True
+            try:
+                self.renderer.show(self.sending.pixels)
+                failed = False
+            except Exception as e:
+                # Any driver error (a transient SPI OSError, say) costs a frame, not the thread.
+                print(f"Display transfer failed: {e!r}")
+                self.errors.inc()
+                # The panel may hold part of the frame; only a full frame is certain.
+                self.renderer.has_last_frame = False
+                failed = True
+            with self.cond:
+                self.busy = False
+                if failed and not self.has_pending:
+                    self.pending, self.sending = self.sending, self.pending
+                    self.has_pending = True
+                self.cond.notify_all()
+            if failed:
+                CLOCK.sleep(DISPLAY_RETRY_DELAY)
+
+
+class StaticLayer:
+    """A composited static layer, kept as RGB for blending and RGB565 for frames."""
+
+    def __init__(self, key, image):
+        self.key = key
+        self.image = image
+        self.pixels = rgb565(image)
+
+
+class StaticLayerCache:
+    """Background plus screen chrome, composited once per (screen, cursor state)."""
+
+    def __init__(self, background, width, height):
+        self.width = width
+        self.height = height
+        self.generation = 0
+        self.set_background(background)
+
+    def set_background(self, background):
+        """Replace the background; layers are rebuilt with a new key generation."""
+        image = Image.new("RGB", (self.width, self.height), color="black")
+        image.paste(background.convert("RGB"))
+        self.background = image
+        self.layers = {}
+        self.generation += 1
+
+    def get(self, screen):
+        key = (self.generation, type(screen).__name__, screen.static_key())
+        layer = self.layers.get(key)
+        if layer is None:
+            image = self.background.copy()
+            screen.draw_static(image)
+            layer = StaticLayer(key, image)
+            self.layers[key] = layer
+        return layer
+
+
+class Backlight:
+    """PWM backlight that only touches the hardware when the level changes.
+
+    With BACKLIGHT_FADE set and an event loop attached, changes ramp over
+    that many seconds in BACKLIGHT_FADE_STEPS steps.
+    """
+
+    def __init__(self, pwm):
+        self.pwm = pwm
+        self.level = None
+        self.target = None
+        self.loop = None
+        self.fade_handle = None
+
+    def attach(self, loop):
+        self.loop = loop
+
+    def set(self, level):
+        if level == self.target:
+            return
+        self.target = level
+        if self.fade_handle is not None:
+            self.fade_handle.cancel()
+            self.fade_handle = None
+        if BACKLIGHT_FADE <= 0 or self.loop is None or self.level is None:
+            self.apply(level)
+        else:
+            self.fade_step(self.level, 1)
+
+    def fade_step(self, start, step):
+        self.apply(round(start + (self.target - start) * step / BACKLIGHT_FADE_STEPS))
+        if step < BACKLIGHT_FADE_STEPS:
+            self.fade_handle = self.loop.call_later(
+                BACKLIGHT_FADE / BACKLIGHT_FADE_STEPS, self.fade_step, start, step + 1)
+        else:
+            self.fade_handle = None
+
+    def apply(self, level):
+        if level == self.level:
+            return
+        if self.level is None:
+            self.pwm.start(level)
+        else:
+            self.pwm.ChangeDutyCycle(level)
+        self.level = level
 
 
 class Menu:
     """Main menu controller."""
 
-    def __init__(self):
+    def __init__(self, backend):
+        self.backend = backend
         self.display_type = "square"
-        self.disp = st7789.ST7789(
-            height=240,
-            rotation=90,
-            port=0,
-            cs=st7789.BG_SPI_CS_FRONT,
-            dc=9,
-            backlight=None,
-            spi_speed_hz=80 * 1000 * 1000,
-            offset_left=0,
-            offset_top=0,
-        )
-
-        GPIO.setmode(GPIO.BCM)
-        GPIO.setup(13, GPIO.OUT)
-        self.backlight = GPIO.PWM(13, 500)
-        self.backlight.start(50)
+        self.disp = backend.create_display()
+        self.backlight = Backlight(backend.create_backlight())
+        self.backlight.set(BACKLIGHT_LEVEL)
+        self.redraw_listener = None
         self.lights_up = True
 
         self.WIDTH = self.disp.width
         self.HEIGHT = self.disp.height
+        self.renderer = Renderer(self.disp, self.WIDTH, self.HEIGHT)
+        self.display = DisplayThread(self.renderer, self.WIDTH, self.HEIGHT)
 
-        # Load background image
-        image_path = "/home/pi/cat.jpg"
-        if os.path.exists(image_path):
-            self.background_image = Image.open(image_path)
-        else:
-            self.background_image = Image.new("RGB", (self.WIDTH, self.HEIGHT), color="black")
+        # The background image is decoded by load_background() after the first frame.
+        self.background_image = Image.new("RGB", (self.WIDTH, self.HEIGHT), color="black")
+        self.layers = StaticLayerCache(self.background_image, self.WIDTH, self.HEIGHT)
+        self.compose_seconds = METRICS.histogram(
+            "clock_frame_compose_seconds", "Time to compose a frame from its layers.")
 
         self.menu_index = 0
         self.alarm_index = 0
         self.editor_index = 1
 
         # Initialize menu components
+        self.audio = AudioEngine()
+        self.connectivity = backend.create_connectivity()
+        self.music = MusicLibrary(self.audio, backend.data_path(MUSIC_DIR))
+        self.stream_cache = StreamCache(backend.data_path(STREAM_CACHE_DIR), backend.open_stream)
+        self.schedule = ScheduleStore(backend.data_path(SCHEDULE_PATH), backend.data_path(LEGACY_SCHEDULE_PATH))
+        self.mixer = VolumeMixer(backend.create_mixer_backend)
+        self.stations = StationList(backend.data_path(STATIONS_PATH))
+        self.radio = RadioController(self.audio, self.stations, self.connectivity)
         self.top_menu = [
-            Alarm(self.WIDTH, self.HEIGHT),
-            AlarmEdit(self.WIDTH, self.HEIGHT),
-            Radio(self.WIDTH, self.HEIGHT),
-            VolumeControl(self.WIDTH, self.HEIGHT),
+            Alarm(self.WIDTH, self.HEIGHT, self.audio, self.connectivity, self.music, self.schedule,
+                  self.stations, self.stream_cache),
+            AlarmEdit(self.WIDTH, self.HEIGHT, self.schedule),
+            Radio(self.WIDTH, self.HEIGHT, self.radio),
+            VolumeControl(self.WIDTH, self.HEIGHT, self.mixer),
         ]
 
-    def check_alarm(self):
-        self.top_menu[self.alarm_index].check_alarm()
+    @property
+    def scheduler(self):
+        return self.top_menu[self.alarm_index].scheduler
+
+    def load_background(self):
+        """Decode the background image, or None; slow, so run off the event loop."""
+        image_path = self.backend.data_path(BACKGROUND_PATH)
+        if not os.path.exists(image_path):
+            return None
+        image = Image.open(image_path)
+        image.load()
+        return image
+
+    def set_background(self, image):
+        self.background_image = image
+        self.layers.set_background(image)
+
+    def start_alarm(self, fire_at=None):
+        self.top_menu[self.alarm_index].start_alarm(fire_at)
+
+    def preroll_alarm(self, fire_at=None):
+        self.top_menu[self.alarm_index].preroll_alarm(fire_at)
+
+    def cancel_preroll(self):
+        self.top_menu[self.alarm_index].cancel_preroll()
+
+    def set_alarm_listener(self, listener):
+        self.top_menu[self.alarm_index].ringing_listener = listener
+
+    def connectivity_changed(self, online):
+        self.top_menu[self.alarm_index].connectivity_changed(online)
 
     def is_alarm_ringing(self):
         return self.top_menu[self.alarm_index].is_alarm_ringing()
 
+    def redraw_in(self):
+        return self.top_menu[self.menu_index].redraw_in()
+
     def dim(self):
         """Turn display backlight off or keep it on if alarm is ringing."""
         if self.is_alarm_ringing():
-            self.backlight.start(100)
+            self.backlight.set(BACKLIGHT_ALARM_LEVEL)
             self.lights_up = True
         else:
-            self.backlight.start(0)
+            self.backlight.set(0)
             self.lights_up = False
 
     def light_up(self):
         """Turn display backlight on and reset alarm if ringing."""
-        self.backlight.start(60)
+        self.backlight.set(BACKLIGHT_LEVEL)
         self.lights_up = True
         self.top_menu[self.alarm_index].reset_alarm()
 
     def refresh(self):
         """Update display with current menu content."""
-        image = self.background_image.copy()
-        self.top_menu[self.menu_index].cdraw(image)
-        self.disp.display(image)
+        started = perf_counter()
+        screen = self.top_menu[self.menu_index]
+        frame = self.display.back
+        frame.begin(self.layers.get(screen))
+        screen.draw_dynamic(frame)
+        self.compose_seconds.observe(perf_counter() - started)
+        self.display.submit()
+
+    def changed(self):
+        """Ask for a redraw; drawn at once when no app paces the redraws."""
+        if self.redraw_listener is not None:
+            self.redraw_listener()
+        else:
+            self.refresh()
 
     def refresh_alarm(self):
-        """Reload alarm settings if in editor mode."""
-        if self.menu_index == self.editor_index:
-            self.top_menu[self.alarm_index].refresh_alarm()
-
-    def check_internet_status(self):
-        self.top_menu[self.alarm_index].internet_status = internet_connection()
+        """Reload alarm settings if the file was edited outside the clock."""
+        self.schedule.reload_if_changed()
 
     def top_prew(self):
-        image = self.background_image.copy()
         if self.top_menu[self.menu_index].cursor_v_index == 0:
             self.menu_index -= 1
             self.menu_index %= len(self.top_menu)
         else:
             self.top_menu[self.menu_index].set_h_cursor(-1)
-        self.top_menu[self.menu_index].cdraw(image)
-        self.disp.display(image)
+        self.changed()
 
     def top_next(self):
-        image = self.background_image.copy()
         if self.top_menu[self.menu_index].cursor_v_index == 0:
             self.menu_index += 1
             self.menu_index %= len(self.top_menu)
         else:
             self.top_menu[self.menu_index].set_h_cursor(1)
-        self.top_menu[self.menu_index].cdraw(image)
-        self.disp.display(image)
+        self.changed()
 
     def bottom_prew(self):
-        image = self.background_image.copy()
         self.top_menu[self.menu_index].set_v_cursor(-1)
-        self.top_menu[self.menu_index].cdraw(image)
-        self.disp.display(image)
+        self.changed()
 
     def bottom_next(self):
-        image = self.background_image.copy()
         self.top_menu[self.menu_index].set_v_cursor(1)
-        self.top_menu[self.menu_index].cdraw(image)
-        self.disp.display(image)
-
-
-def handle_button(pin):
+        self.changed()
+
+    def button_mode(self, pin):
+        """How ButtonInput should treat a press of this button right now."""
+        label = LABELS[BUTTONS.index(pin)]
+        if not self.lights_up or self.is_alarm_ringing():
+            return BUTTON_WAKE
+        repeats = getattr(self.top_menu[self.menu_index], "repeats", None)
+        if repeats is not None and repeats(label):
+            return BUTTON_REPEAT
+        if label == "A":
+            return BUTTON_LONG
+        return BUTTON_TAP
+
+    def long_press(self, pin):
+        """Long press A: back to the clock face."""
+        if LABELS[BUTTONS.index(pin)] == "A":
+            self.menu_index = self.alarm_index
+            self.changed()
+
+
+def handle_button(menu, pin):
     """Handle button press events."""
     label = LABELS[BUTTONS.index(pin)]
     if label == "A":
@@ -711,65 +2898,796 @@ def handle_button(pin):
         menu.top_next()
 
 
-# Initialize the menu system
-menu = Menu()
-menu.refresh()
-
-# Set up GPIO buttons
-for pin in BUTTONS:
-    GPIO.setup(pin, GPIO.IN, pull_up_down=GPIO.PUD_UP)
-    GPIO.add_event_detect(pin, GPIO.FALLING, bouncetime=250)
-
-
-# Set up background threads
-def alarm_thread_func():
-    """Background thread to check alarm status."""
-    while True:
-        menu.check_alarm()
-        sleep(1)
-
-
-def internet_thread_func():
-    """Background thread to check internet connectivity."""
-    while True:
-        if menu.lights_up:
-            menu.check_internet_status()
-        sleep(5)
-
-
-alarm_thread = threading.Thread(target=alarm_thread_func, daemon=True)
-internet_thread = threading.Thread(target=internet_thread_func, daemon=True)
-alarm_thread.start()
-internet_thread.start()
-
-# Main loop
-refresh_counter = 0
-while True:
-    if menu.is_alarm_ringing():
-        menu.menu_index = menu.alarm_index
-        menu.refresh()
-        menu.dim()
-        refresh_counter = 0
-    elif menu.lights_up:
-        menu.refresh()
-
-    # Auto-dim after timeout (about 30 seconds)
-    if refresh_counter > 300:  # 30 seconds at 10 counts/second
-        menu.dim()
-        refresh_counter = 0
+# How a press is delivered, chosen when the button goes down.
+BUTTON_TAP = "tap"  # "press" at once
+BUTTON_REPEAT = "repeat"  # "press" at once, "repeat" while held, "release" at the end
+BUTTON_LONG = "long"  # "press" on a short release, or "long" once held long enough
+BUTTON_WAKE = "wake"  # only "wake"; the press wakes the display
+
+
+class ButtonInput:
+    """Turn raw button edges into press, repeat, long-press and wake events.
+
+    Edges arrive on the GPIO thread; the level is read once it has been
+    stable for BUTTON_DEBOUNCE, on the event loop. `mode(pin)` picks how
+    the press is delivered and `emit(pin, event)` receives the events.
+    Repeats start after BUTTON_REPEAT_DELAY and speed up while held.
+    """
+
+    def __init__(self, loop, read, mode, emit):
+        self.loop = loop
+        self.read = read
+        self.mode = mode
+        self.emit = emit
+        self.settling = {}  # pin -> pending debounce check
+        self.held = {}  # pin -> [mode, timer handle]
+
+    def on_edge(self, pin):
+        """GPIO callback for either edge; runs on the GPIO thread."""
+        self.loop.call_soon_threadsafe(self._edge, pin)
+
+    def _edge(self, pin):
+        handle = self.settling.pop(pin, None)
+        if handle is not None:
+            handle.cancel()
+        self.settling[pin] = self.loop.call_later(BUTTON_DEBOUNCE, self._settled, pin)
+
+    def _settled(self, pin):
+        del self.settling[pin]
+        pressed = self.read(pin)
+        if pressed and pin not in self.held:
+            self._press(pin)
+        elif not pressed and pin in self.held:
+            self._release(pin)
+
+    def _press(self, pin):
+        mode = self.mode(pin)
+        handle = None
+        if mode == BUTTON_WAKE:
+            self.emit(pin, "wake")
+        elif mode == BUTTON_LONG:
+            handle = self.loop.call_later(BUTTON_LONG_PRESS, self._long_press, pin)
+        else:
+            self.emit(pin, "press")
+            if mode == BUTTON_REPEAT:
+                handle = self.loop.call_later(BUTTON_REPEAT_DELAY, self._repeat, pin, BUTTON_REPEAT_INTERVAL)
+        self.held[pin] = [mode, handle]
+
+    def _repeat(self, pin, interval):
+        self.emit(pin, "repeat")
+        interval = max(BUTTON_REPEAT_MIN_INTERVAL, interval * BUTTON_REPEAT_ACCELERATION)
+        self.held[pin][1] = self.loop.call_later(interval, self._repeat, pin, interval)
+
+    def _long_press(self, pin):
+        self.held[pin] = [BUTTON_TAP, None]
+        self.emit(pin, "long")
+
+    def _release(self, pin):
+        mode, handle = self.held.pop(pin)
+        if handle is not None:
+            handle.cancel()
+        if mode == BUTTON_LONG:
+            self.emit(pin, "press")
+        elif mode == BUTTON_REPEAT:
+            self.emit(pin, "release")
+
+
+REFRESH_DARK = "dark"
+REFRESH_INTERACTIVE = "interactive"
+REFRESH_IDLE = "idle"
+
+
+class RefreshGovernor:
+    """Pace redraws in tiers.
+
+    Dark: nothing is drawn and the display task sleeps without a deadline.
+    Interactive, for REFRESH_INTERACTIVE_WINDOW seconds after input: at most
+    REFRESH_INTERACTIVE_FPS frames a second. Idle: the screen's own deadline
+    (the minute boundary on the clock face) and requests, coalesced to at
+    most one frame every REFRESH_IDLE_INTERVAL seconds.
+    """
+
+    def __init__(self, menu):
+        self.menu = menu
+        self.last_input = None
+        self.last_frame = None
+        self.frames = {tier: METRICS.counter("clock_refresh_total", "Frames drawn by refresh tier.", tier=tier)
+                       for tier in (REFRESH_INTERACTIVE, REFRESH_IDLE)}
+
+    def tier(self):
+        if not self.menu.lights_up:
+            return REFRESH_DARK
+        if self.last_input is not None and CLOCK.monotonic() - self.last_input < REFRESH_INTERACTIVE_WINDOW:
+            return REFRESH_INTERACTIVE
+        return REFRESH_IDLE
+
+    def on_input(self):
+        self.last_input = CLOCK.monotonic()
+
+    def timeout(self):
+        """How long the display task may sleep without a request."""
+        return self.menu.redraw_in() if self.menu.lights_up else None
+
+    def hold_off(self, tier):
+        """Seconds to wait before drawing so the tier's rate is kept."""
+        if self.last_frame is None:
+            return 0
+        interval = 1 / REFRESH_INTERACTIVE_FPS if tier == REFRESH_INTERACTIVE else REFRESH_IDLE_INTERVAL
+        return max(0, self.last_frame + interval - CLOCK.monotonic())
+
+    def drawn(self, tier):
+        self.last_frame = CLOCK.monotonic()
+        self.frames[tier].inc()
+
+
+class StartupTimer:
+    """Time the startup phases, relative to main(), and report them once."""
+
+    def __init__(self):
+        self.started = perf_counter()
+        self.phases = OrderedDict()
+
+    def mark(self, phase):
+        elapsed = perf_counter() - self.started
+        self.phases[phase] = elapsed
+        METRICS.reading("gauge", "clock_startup_seconds", "Seconds from start until each startup phase was done.",
+                        lambda: elapsed, phase=phase)
+
+    def report(self):
+        print("startup: " + ", ".join(f"{phase} {elapsed * 1000:.0f} ms" for phase, elapsed in self.phases.items()))
+
+
+class APIError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+API_STATUS_TEXT = {200: "OK", 201: "Created", 400: "Bad Request", 404: "Not Found",
+                   405: "Method Not Allowed", 413: "Payload Too Large"}
+API_ALARM_FIELDS = ("hour", "minute", "days", "date", "enabled", "station", "skip", "skip_holidays")
+
+
+def is_json_int(value):
+    """True for a JSON integer; bool is an int subclass in Python but not in JSON."""
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def parse_alarm_fields(body, stations):
+    """Validate alarm fields from a request body into ScheduleStore form."""
+    if not isinstance(body, dict):
+        raise APIError(400, "expected a JSON object")
+    unknown = set(body) - set(API_ALARM_FIELDS)
+    if unknown:
+        raise APIError(400, f"unknown fields: {', '.join(sorted(unknown))}")
+    fields = {}
+    try:
+        for key, limit in (("hour", 24), ("minute", 60)):
+            if key in body:
+                if not is_json_int(body[key]) or not 0 <= body[key] < limit:
+                    raise APIError(400, f"{key} must be an integer below {limit}")
+                fields[key] = body[key]
+        if "days" in body:
+            if not isinstance(body["days"], list) or not all(is_json_int(day) and 0 <= day < 7
+                                                             for day in body["days"]):
+                raise APIError(400, "days must be a list of weekday numbers 0-6")
+            fields["days"] = sorted(set(body["days"]))
+        if "date" in body:
+            fields["date"] = parse_date(body["date"])
+        if "skip" in body:
+            fields["skip"] = {parse_date(text) for text in body["skip"]}
+    except (TypeError, ValueError):
+        raise APIError(400, "dates must be YYYY-MM-DD")
+    for key in ("enabled", "skip_holidays"):
+        if key in body and not isinstance(body[key], bool):
+            raise APIError(400, f"{key} must be true or false")
+    if "enabled" in body:
+        fields["enabled"] = int(body["enabled"])
+    if "skip_holidays" in body:
+        fields["skip_holidays"] = body["skip_holidays"]
+    if "station" in body:
+        if body["station"] is not None and stations.get(body["station"])["id"] != body["station"]:
+            raise APIError(400, f"unknown station {body['station']!r}")
+        fields["station"] = body["station"]
+    return fields
+
+
+class ControlAPI:
+    """HTTP/1.1 control API on a Unix socket (and optionally TCP), inside the event loop.
+
+    Requests are small JSON exchanges answered on the loop; GET /events is
+    a Server-Sent Events stream. Change notifications are coalesced for
+    API_EVENT_DELAY and each event is encoded once for all clients. Every
+    client has a bounded queue that drops its oldest event when full, so a
+    slow client can only fall behind, never hold up the clock.
+    """
+
+    def __init__(self, menu, redraw):
+        self.menu = menu
+        self.redraw = redraw
+        self.loop = None
+        self.clients = set()
+        self.pending = set()
+        self.flush_handle = None
+        self.requests = METRICS.counter("clock_api_requests_total", "Control API requests.")
+        METRICS.reading("gauge", "clock_api_event_clients", "Connected event stream clients.",
+                        lambda: len(self.clients))
+
+    @property
+    def alarm(self):
+        return self.menu.top_menu[self.menu.alarm_index]
+
+    def changed(self, *kinds):
+        """Queue "status" (the default) and/or "schedule" events; call on the loop thread."""
+        if self.loop is None:
+            return
+        self.pending.update(kinds or ("status",))
+        if self.flush_handle is None:
+            self.flush_handle = self.loop.call_later(API_EVENT_DELAY, self.flush_events)
+
+    def flush_events(self):
+        self.flush_handle = None
+        kinds, self.pending = self.pending, set()
+        if not self.clients:
+            return
+        for kind in sorted(kinds):
+            data = self.schedule() if kind == "schedule" else self.status()
+            event = f"event: {kind}\ndata: {json.dumps(data)}\n\n".encode()
+            for queue in self.clients:
+                if queue.full():
+                    queue.get_nowait()
+                queue.put_nowait(event)
+
+    def status(self):
+        fire_at, next_alarm = self.alarm.get_next_alarm()
+        radio = self.menu.radio
+        return {
+            "time": CLOCK.now().isoformat(timespec="seconds"),
+            "next_alarm": {"at": fire_at.isoformat(), "id": next_alarm["id"]} if next_alarm else None,
+            "alarm": self.alarm.state,
+            "ringing": self.menu.is_alarm_ringing(),
+            "online": self.menu.connectivity.online,
+            "volume": self.menu.mixer.volume,
+            "radio": {"playing": radio.selected, "state": radio.state, "station": radio.station["id"],
+                      "low_bitrate": radio.low},
+        }
+
+    def schedule(self):
+        schedule = self.menu.schedule
+        return {
+            "alarms": [schedule.encode(alarm) for alarm in schedule.alarms],
+            "skip_dates": sorted(day.isoformat() for day in schedule.skip_dates),
+        }
+
+    def find_alarm(self, alarm_id):
+        alarm = self.menu.schedule.alarm(alarm_id)
+        if alarm is None:
+            raise APIError(404, f"no alarm {alarm_id!r}")
+        return alarm
+
+    def route(self, method, path, body):
+        """Handle one request; returns (status, JSON-able result)."""
+        parts = [part for part in urlparse(path).path.split("/") if part]
+        schedule = self.menu.schedule
+        # A stat; answers and edits always start from the file's current contents.
+        schedule.reload_if_changed()
+        if parts == ["status"]:
+            if method == "GET":
+                return 200, self.status()
+        elif parts == ["alarms"]:
+            if method == "GET":
+                return 200, self.schedule()
+            if method == "POST":
+                fields = parse_alarm_fields(body, self.menu.stations)
+                if "hour" not in fields or "minute" not in fields:
+                    raise APIError(400, "hour and minute are required")
+                if "date" in fields and "days" in fields:
+                    raise APIError(400, "an alarm has either days or a date")
+                alarm_id = schedule.add(fields.pop("hour"), fields.pop("minute"), days=fields.pop("days", None),
+                                        on=fields.pop("date", None), **fields)
+                return 201, schedule.encode(schedule.alarm(alarm_id))
+        elif len(parts) == 2 and parts[0] == "alarms":
+            alarm = self.find_alarm(parts[1])
+            if method == "GET":
+                return 200, schedule.encode(alarm)
+            if method in ("PUT", "PATCH"):
+                fields = parse_alarm_fields(body, self.menu.stations)
+                try:
+                    schedule.update_alarm(alarm["id"], **fields)
+                except ValueError as e:
+                    raise APIError(400, str(e))
+                return 200, schedule.encode(alarm)
+            if method == "DELETE":
+                if alarm["id"] in WEEKDAY_ALARM_IDS:
+                    raise APIError(400, "weekday alarms can only be disabled")
+                schedule.remove(alarm["id"])
+                return 200, {"deleted": alarm["id"]}
+        elif len(parts) == 2 and parts[0] == "skip" and method in ("PUT", "DELETE"):
+            try:
+                day = parse_date(parts[1])
+            except ValueError:
+                raise APIError(400, "dates must be YYYY-MM-DD")
+            schedule.skip(day, method == "PUT")
+            return 200, self.schedule()
+        elif parts == ["alarm", "stop"] and method == "POST":
+            self.alarm.reset_alarm()
+            return 200, self.status()
+        elif parts == ["radio"] and method in ("PUT", "PATCH"):
+            if not isinstance(body, dict):
+                raise APIError(400, "expected a JSON object")
+            radio = self.menu.radio
+            if "station" in body:
+                station = self.menu.stations.get(body["station"])
+                if station["id"] != body["station"]:
+                    raise APIError(400, f"unknown station {body['station']!r}")
+                radio.tune(self.menu.stations.stations.index(station) - radio.station_index)
+            if "playing" in body:
+                radio.select(bool(body["playing"]))
+            self.redraw()
+            return 200, self.status()
+        elif parts == ["volume"] and method in ("PUT", "PATCH"):
+            volume = body.get("volume") if isinstance(body, dict) else None
+            if not is_json_int(volume) or not 0 <= volume <= 100:
+                raise APIError(400, "volume must be an integer 0-100")
+            self.menu.mixer.set_volume(volume)
+            self.redraw()
+            return 200, self.status()
+        elif parts == ["events"]:
+            if method == "GET":
+                return 200, None
+        else:
+            raise APIError(404, "no such resource")
+        raise APIError(405, f"{method} not allowed here")
+
+    async def handle(self, reader, writer):
+        try:
+            method, path, body = await asyncio.wait_for(self.read_request(reader), API_REQUEST_TIMEOUT)
+            self.requests.inc()
+            status, result = self.route(method, path, body)
+        except APIError as e:
+            status, result = e.status, {"error": str(e)}
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError, ValueError, OSError):
+            writer.close()
+            return
+        try:
+            if result is None:
+                await self.stream_events(writer)
+            else:
+                payload = json.dumps(result).encode()
+                writer.write(f"HTTP/1.1 {status} {API_STATUS_TEXT[status]}\r\n"
+                             f"Content-Type: application/json\r\nContent-Length: {len(payload)}\r\n"
+                             f"Connection: close\r\n\r\n".encode() + payload)
+                await writer.drain()
+        except (ConnectionError, OSError):
+            pass
+        finally:
+            writer.close()
+
+    async def read_request(self, reader):
+        method, path, _ = (await reader.readline()).decode("latin-1").split(" ", 2)
+        length = 0
+        while True:
+            line = (await reader.readline()).decode("latin-1").strip()
+            if not line:
+                break
+            name, _, value = line.partition(":")
+            if name.strip().lower() == "content-length":
+                length = int(value)
+        if length > API_MAX_BODY:
+            raise APIError(413, "request body too large")
+        body = None
+        if length:
+            try:
+                body = json.loads(await reader.readexactly(length))
+            except json.JSONDecodeError:
+                raise APIError(400, "body is not valid JSON")
+        return method.upper(), path, body
+
+    async def stream_events(self, writer):
+        """Send a status and schedule event now, then every change until the client goes away."""
+        queue = asyncio.Queue(API_CLIENT_QUEUE)
+        writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\nCache-Control: no-cache\r\n\r\n")
+        for kind, data in (("status", self.status()), ("schedule", self.schedule())):
+            writer.write(f"event: {kind}\ndata: {json.dumps(data)}\n\n".encode())
+        self.clients.add(queue)
+        try:
+            while True:
+                await writer.drain()
+                try:
+                    event = await asyncio.wait_for(queue.get(), API_KEEPALIVE)
+                except asyncio.TimeoutError:
+                    event = b": keepalive\n\n"
+                writer.write(event)
+        finally:
+            self.clients.discard(queue)
+
+    async def serve(self, path, port=None):
+        self.loop = asyncio.get_running_loop()
+        servers = []
+        try:
+            if os.path.exists(path):
+                os.unlink(path)
+            servers.append(await asyncio.start_unix_server(self.handle, path))
+            if port:
+                servers.append(await asyncio.start_server(self.handle, API_HOST, port))
+        except OSError as e:
+            print(f"control API unavailable: {e}")
+            if not servers:
+                return
+        await asyncio.gather(*(server.serve_forever() for server in servers))
+
+
+class ClockApp:
+    """Event-driven main loop.
+
+    Wakes only on button interrupts, when the visible screen needs a redraw
+    (minute boundary, message timeout), on the dim timeout and on alarm
+    deadlines instead of polling every 100 ms. Every wakeup, including the
+    background clock step checks, probes and rescans, is counted by reason.
+    """
+
+    def __init__(self, menu, startup=None):
+        self.menu = menu
+        self.startup = startup or StartupTimer()
+        self.loop = None
+        self.buttons = None
+        self.input = None
+        self.redraw = None
+        self.awake = None
+        self.cache_poke = None
+        self.audio_started = None
+        self.api = ControlAPI(menu, self.request_redraw)
+        self.dim_handle = None
+        self.governor = RefreshGovernor(menu)
+        self.wakeups = deque(maxlen=1000)
+        self.wakeup_counters = {reason: METRICS.counter("clock_wakeups_total", "Event loop wakeups by reason.",
+                                                        reason=reason)
+                                for reason in ("input", "redraw", "alarm", "clock_check", "connectivity",
+                                               "stream_cache", "music", "stations", "schedule")}
+        METRICS.reading("gauge", "clock_wakeups_per_minute", "Event loop wakeups during the last minute.",
+                        self.wakeups_per_minute)
+
+    async def run(self):
+        self.loop = asyncio.get_running_loop()
+        self.buttons = asyncio.Queue()
+        self.redraw = asyncio.Event()
+        self.awake = asyncio.Event()
+        self.cache_poke = asyncio.Event()
+        self.audio_started = asyncio.Event()
+
+        self.input = ButtonInput(self.loop, self.menu.backend.button_pressed, self.menu.button_mode,
+                                 self.on_button)
+        self.menu.backend.setup_buttons(BUTTONS, self.input.on_edge)
+
+        self.menu.redraw_listener = self.request_redraw
+        self.menu.scheduler.wakeup_listener = self.count_wakeup
+        self.menu.connectivity.wakeup_listener = self.count_wakeup
+        self.menu.music.wakeup_listener = self.count_wakeup
+        self.menu.stations.wakeup_listener = self.count_wakeup
+        self.menu.backlight.attach(self.loop)
+        self.menu.set_alarm_listener(self.on_alarm_state)
+        self.menu.connectivity.listeners.append(lambda online: self.request_redraw())
+        self.menu.mixer.attach(self.loop)
+        self.menu.mixer.listeners.append(lambda volume, failed: self.request_redraw())
+        self.menu.radio.attach(self.loop)
+        self.menu.radio.listeners.append(self.request_redraw)
+        self.menu.radio.listeners.append(self.cache_poke.set)
+        self.menu.connectivity.listeners.append(lambda online: self.cache_poke.set())
+        self.menu.schedule.listeners.append(lambda: self.loop.call_soon_threadsafe(self.cache_poke.set))
+        self.menu.stream_cache.listeners.append(lambda: self.loop.call_soon_threadsafe(self.cache_poke.set))
+        self.menu.radio.listeners.append(self.api.changed)
+        self.menu.connectivity.listeners.append(lambda online: self.api.changed())
+        self.menu.mixer.listeners.append(lambda volume, failed: self.api.changed())
+        self.menu.mixer.set_listeners.append(lambda volume: self.api.changed())
+        self.menu.schedule.listeners.append(
+            lambda: self.loop.call_soon_threadsafe(self.api.changed, "schedule", "status"))
+        self.awake.set()
+        self.reset_dim_timer()
+        tasks = [
+            self.input_task(),
+            self.display_task(),
+            self.alarm_task(),
+            self.menu.connectivity.run(self.awake),
+            self.menu.stations.run(),
+            self.stream_cache_task(),
+            self.schedule_watch_task(),
+            self.start_subsystems(),
+            self.index_music(),
+            METRICS.serve(self.menu.backend.data_path(METRICS_SOCKET)),
+            self.api.serve(self.menu.backend.data_path(API_SOCKET), API_PORT),
+        ]
+        if METRICS_TEXTFILE:
+            tasks.append(METRICS.write_textfile(self.menu.backend.data_path(METRICS_TEXTFILE)))
+        await asyncio.gather(*tasks)
+
+    async def start_subsystems(self):
+        """Bring up what the first frame did not need."""
+        image = await self.loop.run_in_executor(None, self.menu.load_background)
+        if image is not None:
+            self.menu.set_background(image)
+            self.request_redraw()
+        self.startup.mark("background")
+        await self.loop.run_in_executor(None, self.menu.audio.start)
+        self.startup.mark("audio")
+        self.audio_started.set()
+        await self.loop.run_in_executor(None, self.menu.mixer.ready.wait)
+        self.startup.mark("mixer")
+        self.startup.report()
+
+    async def index_music(self):
+        """Index the music once libvlc is up, whatever becomes of the mixer."""
+        await self.audio_started.wait()
+        await self.menu.music.run()
+
+    def on_button(self, pin, event):
+        self.buttons.put_nowait((pin, event))
+
+    def request_redraw(self):
+        """Redraw soon; dropped while the display is dark."""
+        if self.menu.lights_up:
+            self.redraw.set()
+
+    def count_wakeup(self, reason):
+        self.wakeups.append(CLOCK.monotonic())
+        self.wakeup_counters[reason].inc()
+
+    def wakeups_per_minute(self):
+        since = CLOCK.monotonic() - 60
+        return sum(1 for woke_at in self.wakeups if woke_at >= since)
+
+    def reset_dim_timer(self):
+        if self.dim_handle is not None:
+            self.dim_handle.cancel()
+        self.dim_handle = self.loop.call_later(DIM_TIMEOUT, self.on_dim_timeout)
+
+    def on_dim_timeout(self):
+        self.dim_handle = None
+        self.menu.dim()
+        if not self.menu.lights_up:
+            self.awake.clear()
+
+    def wake(self):
+        self.awake.set()
+        self.reset_dim_timer()
+        self.request_redraw()
+
+    async def input_task(self):
+        while True:
+            pin, event = await self.buttons.get()
+            self.count_wakeup("input")
+            self.governor.on_input()
+            if event == "wake":
+                self.menu.refresh_alarm()
+                self.menu.light_up()
+            elif event in ("press", "repeat"):
+                # Edits start from the file's current contents.
+                self.menu.refresh_alarm()
+                handle_button(self.menu, pin)
+            elif event == "long":
+                self.menu.long_press(pin)
+            elif event == "release":
+                # A held edit is saved once, when the button is let go.
+                self.loop.run_in_executor(None, self.menu.schedule.flush)
+            self.wake()
+
+    async def display_task(self):
+        while True:
+            try:
+                await asyncio.wait_for(self.redraw.wait(), self.governor.timeout())
+            except asyncio.TimeoutError:
+                pass
+            tier = self.governor.tier()
+            if tier == REFRESH_DARK:
+                self.redraw.clear()
+                continue
+            delay = self.governor.hold_off(tier)
+            if delay > 0:
+                # Requests arriving meanwhile are folded into this frame.
+                await asyncio.sleep(delay)
+            self.redraw.clear()
+            self.count_wakeup("redraw")
+
+            if self.menu.is_alarm_ringing():
+                self.menu.menu_index = self.menu.alarm_index
+            if self.menu.lights_up:
+                self.menu.refresh()
+                self.governor.drawn(tier)
+
+    async def alarm_task(self):
+        await self.menu.scheduler.run(self.on_alarm, self.on_preroll, self.menu.cancel_preroll)
+
+    def on_alarm(self, fire_at):
+        self.count_wakeup("alarm")
+        self.menu.start_alarm(fire_at)
+        # Find a dead network now rather than by the connect timeout.
+        self.loop.create_task(self.verify_connectivity())
+
+    def on_preroll(self, fire_at):
+        self.count_wakeup("alarm")
+        self.menu.preroll_alarm(fire_at)
+        self.loop.create_task(self.verify_connectivity())
+
+    async def verify_connectivity(self):
+        """Check the network now so a dead link switches to the fallback early."""
+        online = await self.menu.connectivity.probe()
+        self.menu.connectivity_changed(online)
+
+    def cache_plan(self):
+        """The URL the stream cache should record now (or None), and seconds until that changes.
+
+        It records the next alarm's station from STREAM_CACHE_WINDOW before
+        the alarm, and while the radio plays if the cache is stale; never
+        offline or while ringing. A None delay waits for a poke.
+        """
+        alarm = self.menu.top_menu[self.menu.alarm_index]
+        fire_at, _ = alarm.get_next_alarm()
+        # A stale status is still used; the probe's result pokes this task again if it differs.
+        self.menu.connectivity.refresh_if_stale()
+        if not self.menu.connectivity.online or self.menu.is_alarm_ringing():
+            return None, None
+        url = alarm.station_url(fire_at)
+        if fire_at is not None:
+            window_in = fire_at.timestamp() - STREAM_CACHE_WINDOW - CLOCK.time()
+            if window_in <= 0:
+                return url, fire_at.timestamp() - CLOCK.time() + 1
+        else:
+            window_in = None
+        if self.menu.radio.selected and self.menu.stream_cache.stale():
+            return url, window_in
+        return None, window_in
+
+    async def schedule_watch_task(self):
+        """Pick up hand edits of the schedule file without waiting for a press or request."""
+        while True:
+            await asyncio.sleep(SCHEDULE_WATCH_INTERVAL)
+            self.count_wakeup("schedule")
+            # Listeners reschedule the alarm and push a schedule event.
+            self.menu.schedule.reload_if_changed()
+
+    async def stream_cache_task(self):
+        try:
+            while True:
+                self.cache_poke.clear()
+                url, recheck_in = self.cache_plan()
+                if url is None:
+                    self.menu.stream_cache.stop()
+                else:
+                    self.menu.stream_cache.record(url)
+                try:
+                    await asyncio.wait_for(self.cache_poke.wait(), recheck_in)
+                except asyncio.TimeoutError:
+                    pass
+                self.count_wakeup("stream_cache")
+        finally:
+            self.menu.stream_cache.stop()
+
+    def on_alarm_state(self, ringing):
+        if ringing:
+            self.menu.dim()
+            self.awake.set()
+        else:
+            self.reset_dim_timer()
+        self.cache_poke.set()
+        self.api.changed()
+        self.request_redraw()
+
+
+class PiBackend:
+    """The real hardware: RPi.GPIO buttons and backlight, the ST7789 over SPI, libvlc."""
+
+    name = "pi"
+
+    def __init__(self):
+        import RPi.GPIO as GPIO
+        import st7789
+        import vlc
+        self.gpio = GPIO
+        self.st7789 = st7789
+        self.vlc = vlc
+        self.clock = Clock()
+
+    def data_path(self, path):
+        return path
+
+    def create_display(self):
+        return self.st7789.ST7789(
+            height=240,
+            rotation=90,
+            port=0,
+            cs=self.st7789.BG_SPI_CS_FRONT,
+            dc=9,
+            backlight=None,
+            spi_speed_hz=80 * 1000 * 1000,
+            offset_left=0,
+            offset_top=0,
+        )
+
+    def create_backlight(self):
+        self.gpio.setmode(self.gpio.BCM)
+        self.gpio.setup(13, self.gpio.OUT)
+        return self.gpio.PWM(13, 500)
+
+    def create_connectivity(self):
+        return ConnectivityMonitor()
+
+    def create_mixer_backend(self):
+        return open_mixer_backend()
+
+    def open_stream(self, url):
+        return urlopen(url, timeout=STREAM_CACHE_TIMEOUT)
+
+    def setup_buttons(self, pins, callback):
+        """Call callback(pin) on every edge; ButtonInput debounces in software."""
+        for pin in pins:
+            self.gpio.setup(pin, self.gpio.IN, pull_up_down=self.gpio.PUD_UP)
+            self.gpio.add_event_detect(pin, self.gpio.BOTH, callback=callback)
+
+    def button_pressed(self, pin):
+        return self.gpio.input(pin) == self.gpio.LOW
+
+
+def use_backend(backend):
+    """Make the backend's clock and audio library the ones the clock runs on."""
+    global CLOCK, vlc
+    CLOCK = backend.clock
+    vlc = backend.vlc
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Raspberry Pi alarm clock and radio.")
+    parser.add_argument("--backend", choices=("pi", "sim"), default=os.environ.get(BACKEND_ENV, "pi"))
+    parser.add_argument("--speed", type=float, default=1, help="sim: simulated seconds per real second")
+    parser.add_argument("--start", type=datetime.fromisoformat, help="sim: wall clock start, ISO format")
+    parser.add_argument("--duration", type=float, help="sim: stop after this many simulated seconds")
+    parser.add_argument("--home", help="sim: directory standing in for /home/pi (default: a temporary one)")
+    parser.add_argument("--alarm", help="sim: HH:MM alarm for every day, written to a missing schedule")
+    parser.add_argument("--script", help="sim: file of '<seconds> <action>' lines, see simulator.load_sim_script()")
+    parser.add_argument("--frames", help="sim: directory to write every frame to as PNG")
+    parser.add_argument("--stream-latency", type=float, default=1.0, help="sim: seconds until the stream plays")
+    parser.add_argument("--stream-failure", help="sim: how the stream fails, see simulator.SIM_STREAM_FAILURES")
+    args = parser.parse_args()
+    startup = StartupTimer()
+
+    if args.backend == "sim":
+        import simulator  # off-device only; the Pi never loads it
+        if args.stream_failure not in (None,) + simulator.SIM_STREAM_FAILURES:
+            parser.error(f"--stream-failure must be one of: {', '.join(simulator.SIM_STREAM_FAILURES)}")
+        backend = simulator.SimBackend(
+            sys.modules[__name__],
+            speed=args.speed,
+            start=args.start,
+            home=args.home,
+            alarm=args.alarm,
+            script=simulator.load_sim_script(args.script) if args.script else (),
+            frames_dir=args.frames,
+            stream_latency=args.stream_latency,
+            stream_failure=args.stream_failure,
+        )
     else:
-        refresh_counter += 1
-
-    sleep(0.100)  # 100ms refresh rate
-
-    # Check for button presses
-    for pin in BUTTONS:
-        if GPIO.event_detected(pin):
-            if not menu.lights_up or menu.is_alarm_ringing():
-                menu.refresh_alarm()
-                menu.refresh()
-                menu.light_up()
-            elif menu.lights_up:
-                handle_button(pin)
-                menu.refresh_alarm()
-            refresh_counter = 0
+        backend = PiBackend()
+    use_backend(backend)
+    startup.mark("backend")
+
+    menu = Menu(backend)
+    startup.mark("menu")
+    menu.refresh()
+    menu.display.wait_idle()
+    startup.mark("first_frame")
+    loop = CLOCK.new_event_loop()
+    try:
+        loop.run_until_complete(run_for(ClockApp(menu, startup).run(), args.duration))
+    finally:
+        menu.schedule.flush()
+        loop.close()
+
+
+async def run_for(coro, duration=None):
+    """Run the app, for `duration` (simulated) seconds if given."""
+    try:
+        await asyncio.wait_for(coro, duration)
+    except asyncio.TimeoutError:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,432 @@
+"""Simulated hardware for running, testing and profiling the clock off the Pi.
+
+Loaded by `rpi-alarmclock.py --backend sim`, benchmark.py and the tests;
+the clock itself only knows the backend interface. SimBackend gets the
+clock module passed in, because its file name cannot be imported.
+"""
+import asyncio
+import json
+import os
+import selectors
+import tempfile
+import threading
+from datetime import datetime
+from time import monotonic, sleep
+from types import SimpleNamespace
+
+import numpy as np
+
+HOME_DIR = "/home/pi"  # paths under it are rebased into the simulator's own directory
+SIM_TRACK_DURATION = 180  # seconds each simulated local track plays
+SIM_STREAM_RATE = 16000  # bytes per second read from a simulated stream (128 kbit/s)
+
+
+class ScaledSelector(selectors.DefaultSelector):
+    """Selector whose timeouts are in simulated seconds."""
+
+    def __init__(self, speed):
+        super().__init__()
+        self.speed = speed
+
+    def select(self, timeout=None):
+        if timeout is not None:
+            timeout /= self.speed
+        return super().select(timeout)
+
+
+class ScaledEventLoop(asyncio.SelectorEventLoop):
+    """Event loop that runs call_later, sleeps and timeouts on a SimClock."""
+
+    def __init__(self, clock):
+        super().__init__(ScaledSelector(clock.speed))
+        self.clock = clock
+
+    def time(self):
+        return self.clock.monotonic()
+
+
+class SimClock:
+    """Clock running `speed` times faster than real time from a chosen start.
+
+    Offers the same methods as the clock module's Clock.
+    """
+
+    def __init__(self, speed=1, start=None):
+        self.speed = speed
+        self.real_base = monotonic()
+        self.wall_base = (start or datetime.now()).timestamp()
+
+    def elapsed(self):
+        return (monotonic() - self.real_base) * self.speed
+
+    def monotonic(self):
+        return self.real_base + self.elapsed()
+
+    def time(self):
+        return self.wall_base + self.elapsed()
+
+    def now(self):
+        return datetime.fromtimestamp(self.time())
+
+    def sleep(self, seconds):
+        sleep(seconds / self.speed)
+
+    def timer(self, delay, callback):
+        """Return an unstarted daemon threading.Timer."""
+        timer = threading.Timer(delay / self.speed, callback)
+        timer.daemon = True
+        return timer
+
+    def new_event_loop(self):
+        return ScaledEventLoop(self)
+
+
+SIM_STREAM_FAILURES = ("error", "timeout", "drop", "stall")
+
+
+class SimEventType:
+    MediaPlayerOpening = "MediaPlayerOpening"
+    MediaPlayerBuffering = "MediaPlayerBuffering"
+    MediaPlayerPlaying = "MediaPlayerPlaying"
+    MediaPlayerStopped = "MediaPlayerStopped"
+    MediaPlayerEncounteredError = "MediaPlayerEncounteredError"
+    MediaPlayerEndReached = "MediaPlayerEndReached"
+
+
+class SimEvent:
+    def __init__(self, event_type, new_cache=None):
+        self.type = event_type
+        self.u = SimpleNamespace(new_cache=new_cache)
+
+
+class SimMedia:
+    def __init__(self, mrl):
+        self.mrl = mrl
+
+    def parse(self):
+        pass
+
+    def get_duration(self):
+        """Local files last SIM_TRACK_DURATION; anything else is unparseable."""
+        return SIM_TRACK_DURATION * 1000 if os.path.isfile(self.mrl) else -1
+
+    def release(self):
+        pass
+
+
+class SimPlayer:
+    """Fake libvlc player with controllable stream latency and failures.
+
+    Events are emitted from timer threads like libvlc's own. `audible`
+    records (monotonic time, mrl) each time sound starts, i.e. the player
+    is playing and not muted.
+    """
+
+    def __init__(self, audio):
+        self.audio = audio
+        self.media = None
+        self.muted = False
+        self.playing = False
+        self.sounding = False
+        self.audible = []
+        self.callbacks = {}
+        self.generation = 0
+        self.lock = threading.RLock()
+
+    def event_manager(self):
+        return self
+
+    def event_attach(self, event_type, callback):
+        self.callbacks.setdefault(event_type, []).append(callback)
+
+    def set_media(self, media):
+        self.media = media
+
+    def audio_set_mute(self, muted):
+        with self.lock:
+            self.muted = muted
+            self._update_sound()
+
+    def is_playing(self):
+        return self.playing
+
+    def play(self):
+        with self.lock:
+            self.generation += 1
+            mrl = self.media.mrl
+            if os.path.isfile(mrl):
+                latency, failure = self.audio.local_latency, None
+            else:
+                latency, failure = self.audio.stream_latency, self.audio.stream_failure
+
+            self._after(0, SimEventType.MediaPlayerOpening)
+            if failure == "error":
+                self._after(latency, SimEventType.MediaPlayerEncounteredError)
+            elif failure == "timeout":
+                self._after(latency, SimEventType.MediaPlayerBuffering, 0)
+            else:
+                self._after(latency, SimEventType.MediaPlayerPlaying)
+                if failure == "drop":
+                    self._after(latency + self.audio.failure_after, SimEventType.MediaPlayerEncounteredError)
+                elif failure == "stall":
+                    self._after(latency + self.audio.failure_after, SimEventType.MediaPlayerBuffering, 0)
+                elif os.path.isfile(mrl):
+                    self._after(latency + SIM_TRACK_DURATION, SimEventType.MediaPlayerEndReached)
+
+    def stop(self):
+        with self.lock:
+            self.generation += 1
+            if self.playing or self.sounding:
+                self._emit(self.generation, SimEventType.MediaPlayerStopped)
+
+    def _after(self, delay, event_type, new_cache=None):
+        generation = self.generation
+        self.audio.clock.timer(delay, lambda: self._emit(generation, event_type, new_cache)).start()
+
+    def _emit(self, generation, event_type, new_cache=None):
+        with self.lock:
+            if generation != self.generation:
+                return
+            if event_type == SimEventType.MediaPlayerPlaying:
+                self.playing = True
+            elif event_type == SimEventType.MediaPlayerBuffering:
+                self.playing = new_cache is not None and new_cache >= 100
+            elif event_type != SimEventType.MediaPlayerOpening:
+                self.playing = False
+            self._update_sound()
+        for callback in self.callbacks.get(event_type, ()):
+            callback(SimEvent(event_type, new_cache))
+
+    def _update_sound(self):
+        sounding = self.playing and not self.muted
+        if sounding and not self.sounding:
+            self.audible.append((self.audio.clock.monotonic(), self.media.mrl))
+        self.sounding = sounding
+
+
+class SimInstance:
+    def __init__(self, audio):
+        self.audio = audio
+
+    def media_player_new(self):
+        player = SimPlayer(self.audio)
+        self.audio.players.append(player)
+        return player
+
+    def media_new(self, mrl):
+        return SimMedia(mrl)
+
+    def media_new_path(self, path):
+        return SimMedia(path)
+
+
+class SimAudio:
+    """Stands in for the vlc module: EventType, Instance() and the failure knobs."""
+
+    EventType = SimEventType
+
+    def __init__(self, clock, stream_latency=1.0, stream_failure=None, failure_after=5, local_latency=0.05):
+        self.clock = clock
+        self.stream_latency = stream_latency
+        self.stream_failure = stream_failure
+        self.failure_after = failure_after
+        self.local_latency = local_latency
+        self.players = []
+
+    def Instance(self):
+        return SimInstance(self)
+
+
+class SimDisplay:
+    """ST7789 stand-in keeping the panel contents in memory, optionally as PNGs."""
+
+    def __init__(self, to_image, width=240, height=240, rotation=90, frames_dir=None):
+        self.to_image = to_image
+        self.width = width
+        self.height = height
+        self._rotation = rotation
+        self.frames_dir = frames_dir
+        self.panel = np.zeros((height, width), dtype=">u2")
+        self.window = (0, 0, width - 1, height - 1)
+        self.frames = 0
+        self.bytes_sent = 0
+        if frames_dir:
+            os.makedirs(frames_dir, exist_ok=True)
+
+    def set_window(self, x0=0, y0=0, x1=None, y1=None):
+        self.window = (x0, y0, self.width - 1 if x1 is None else x1,
+                       self.height - 1 if y1 is None else y1)
+
+    def data(self, data):
+        x0, y0, x1, y1 = self.window
+        pixels = np.frombuffer(data, dtype=">u2").reshape(y1 - y0 + 1, x1 - x0 + 1)
+        self.panel[y0:y1 + 1, x0:x1 + 1] = pixels
+        self.bytes_sent += pixels.nbytes
+
+    def present(self):
+        """Called by the renderer once a frame is complete."""
+        self.frames += 1
+        if self.frames_dir:
+            self.snapshot().save(os.path.join(self.frames_dir, f"frame-{self.frames:06d}.png"))
+
+    def snapshot(self):
+        """The screen as the user sees it, undoing the panel rotation."""
+        pixels = np.rot90(self.panel, -(self._rotation // 90))
+        return self.to_image(np.ascontiguousarray(pixels))
+
+
+class SimBacklight:
+    def __init__(self):
+        self.duty = 0
+        self.changes = 0
+
+    def start(self, duty):
+        self.duty = duty
+        self.changes += 1
+
+    def ChangeDutyCycle(self, duty):
+        self.start(duty)
+
+
+class SimMixer:
+    def __init__(self, volume=50):
+        self.volume = volume
+
+    def get_volume(self):
+        return self.volume
+
+    def set_volume(self, volume):
+        self.volume = volume
+        return True
+
+    def poll_fd(self):
+        return None
+
+    def handle_events(self):
+        pass
+
+
+class SimStream:
+    """An endless stream of silence at SIM_STREAM_RATE while the simulator is online."""
+
+    def __init__(self, backend):
+        self.backend = backend
+
+    def read(self, size):
+        self.backend.clock.sleep(size / SIM_STREAM_RATE)
+        if not self.backend.online:
+            raise OSError("simulated network is down")
+        return bytes(size)
+
+    def close(self):
+        pass
+
+
+def load_sim_script(path):
+    """Parse '<seconds> <action>' lines; '#' starts a comment.
+
+    Actions: a button label, 'hold <label> <seconds>', 'online' or 'offline'.
+    """
+    script = []
+    with open(path) as script_file:
+        for line in script_file:
+            line = line.split("#", 1)[0].strip()
+            if line:
+                at, action = line.split(None, 1)
+                script.append((float(at), action.strip()))
+    return script
+
+
+class SimBackend:
+    """Simulated hardware for running and profiling the clock off the Pi.
+
+    `app` is the clock module (rpi-alarmclock.py) it stands in for. Paths
+    under HOME_DIR are rebased into `home`, buttons come from a scripted
+    event source (or press()), and everything runs on a SimClock.
+    """
+
+    name = "sim"
+
+    def __init__(self, app, speed=1, start=None, home=None, alarm=None, script=(), frames_dir=None,
+                 stream_latency=1.0, stream_failure=None, online=True):
+        self.app = app
+        self.clock = SimClock(speed, start)
+        self.vlc = SimAudio(self.clock, stream_latency, stream_failure)
+        self.home = home or tempfile.mkdtemp(prefix="alarmclock-sim-")
+        self.script = list(script)
+        self.frames_dir = frames_dir
+        self.online = online
+        self.probe_latency = 0.01
+        self.display = None
+        self.backlight = None
+        self.button_callback = None
+        self.pressed = set()
+
+        schedule_path = self.data_path(app.SCHEDULE_PATH)
+        if not os.path.exists(schedule_path) and not os.path.exists(self.data_path(app.LEGACY_SCHEDULE_PATH)):
+            os.makedirs(os.path.dirname(schedule_path), exist_ok=True)
+            hour, minute = map(int, alarm.split(":")) if alarm else (6, 0)
+            alarms = [{"id": f"day{day}", "days": [day], "hour": hour, "minute": minute, "enabled": bool(alarm)}
+                      for day in range(7)]
+            with open(schedule_path, "w") as schedule_file:
+                json.dump({"version": app.SCHEDULE_VERSION, "alarms": alarms}, schedule_file, indent=2)
+
+    def data_path(self, path):
+        if os.path.commonpath([path, HOME_DIR]) != HOME_DIR:
+            return path
+        return os.path.join(self.home, os.path.relpath(path, HOME_DIR))
+
+    def create_display(self):
+        self.display = SimDisplay(self.app.Renderer.to_image, frames_dir=self.frames_dir)
+        return self.display
+
+    def create_backlight(self):
+        self.backlight = SimBacklight()
+        return self.backlight
+
+    def create_connectivity(self):
+        """The real monitor, with probes answered from `online` instead of the network."""
+        monitor = self.app.ConnectivityMonitor()
+        monitor.reachable = self.reachable
+        return monitor
+
+    async def reachable(self):
+        await asyncio.sleep(self.probe_latency)
+        return self.online
+
+    def create_mixer_backend(self):
+        return SimMixer()
+
+    def open_stream(self, url):
+        return SimStream(self)
+
+    def setup_buttons(self, pins, callback):
+        self.button_callback = callback
+        if self.script:
+            threading.Thread(target=self._play_script, daemon=True).start()
+
+    def button_pressed(self, pin):
+        return pin in self.pressed
+
+    def press(self, label, hold=0.1):
+        """Press and hold a button (A, B, X, Y) for `hold` simulated seconds, as the GPIO thread would."""
+        pin = self.app.BUTTONS[self.app.LABELS.index(label)]
+        self.pressed.add(pin)
+        self.button_callback(pin)
+        self.clock.sleep(hold)
+        self.pressed.discard(pin)
+        self.button_callback(pin)
+
+    def _play_script(self):
+        started = self.clock.monotonic()
+        for at, action in sorted(self.script):
+            self.clock.sleep(max(0, started + at - self.clock.monotonic()))
+            if action in self.app.LABELS:
+                self.press(action)
+            elif action.startswith("hold "):
+                _, label, seconds = action.split()
+                self.press(label, float(seconds))
+            elif action in ("online", "offline"):
+                self.online = action == "online"
+            else:
+                print(f"sim: unknown script action {action!r}")
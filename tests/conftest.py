@@ -0,0 +1,28 @@
+import importlib.util
+import os
+import sys
+
+import pytest
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CLOCK_SCRIPT = os.path.join(REPO_DIR, "rpi-alarmclock.py")
+sys.path.insert(0, REPO_DIR)  # for simulator.py
+
+
+@pytest.fixture(scope="session")
+def clock():
+    """rpi-alarmclock.py as a module (not importable by name because of the dash)."""
+    spec = importlib.util.spec_from_file_location("alarmclock", CLOCK_SCRIPT)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+@pytest.fixture
+def schedule(clock, tmp_path):
+    """An empty schedule store in a temporary directory; pending saves are flushed at the end."""
+    path = tmp_path / "alarmclock.json"
+    path.write_text('{"version": 1, "alarms": []}\n')
+    store = clock.ScheduleStore(str(path), str(tmp_path / "alarmclock.csv"))
+    yield store
+    store.flush()
@@ -0,0 +1,130 @@
+import json
+import os
+from datetime import date
+from types import SimpleNamespace
+
+import pytest
+
+import simulator
+
+
+@pytest.fixture
+def stations(clock, tmp_path):
+    path = tmp_path / "stations.json"
+    path.write_text('[{"id": "one", "url": "http://one/s"}, {"id": "two", "url": "http://two/s"}]')
+    return clock.StationList(str(path))
+
+
+@pytest.fixture
+def api(clock, schedule, stations):
+    menu = SimpleNamespace(schedule=schedule, stations=stations)
+    return clock.ControlAPI(menu, lambda: None)
+
+
+def rejected(clock, body, stations):
+    with pytest.raises(clock.APIError) as error:
+        clock.parse_alarm_fields(body, stations)
+    return error.value.status
+
+
+def test_parses_every_field(clock, stations):
+    body = {"hour": 6, "minute": 45, "days": [4, 0, 4], "enabled": False, "station": "two",
+            "skip": ["2026-12-24"], "skip_holidays": True}
+    assert clock.parse_alarm_fields(body, stations) == {
+        "hour": 6, "minute": 45, "days": [0, 4], "enabled": 0, "station": "two",
+        "skip": {date(2026, 12, 24)}, "skip_holidays": True}
+    assert clock.parse_alarm_fields({"date": "2026-11-02", "station": None}, stations) == {
+        "date": date(2026, 11, 2), "station": None}
+
+
+@pytest.mark.parametrize("body", [
+    [],
+    {"id": "x"},
+    {"hour": 24},
+    {"minute": -1},
+    {"hour": "7"},
+    {"hour": 7.0},
+    {"hour": True},
+    {"minute": False},
+    {"days": 3},
+    {"days": [7]},
+    {"days": [True]},
+    {"days": ["1"]},
+    {"date": "tomorrow"},
+    {"date": 20261102},
+    {"skip": ["2026-02-30"]},
+    {"skip": 5},
+    {"station": "three"},
+    {"enabled": "nope"},
+    {"enabled": 1},
+    {"enabled": None},
+    {"skip_holidays": "yes"},
+    {"skip_holidays": 0},
+])
+def test_rejects_bad_fields(clock, stations, body):
+    assert rejected(clock, body, stations) == 400
+
+
+def test_post_needs_hour_minute_and_one_kind_of_repetition(clock, api):
+    with pytest.raises(clock.APIError):
+        api.route("POST", "/alarms", {"hour": 6})
+    with pytest.raises(clock.APIError):
+        api.route("POST", "/alarms", {"hour": 6, "minute": 0, "days": [1], "date": "2026-11-02"})
+    status, alarm = api.route("POST", "/alarms", {"hour": 6, "minute": 0, "date": "2026-11-02"})
+    assert status == 201 and alarm["date"] == "2026-11-02"
+
+
+@pytest.mark.parametrize("body", [{"days": [1]}, {"days": [0, 1]}, {"date": "2026-11-02"}])
+def test_weekday_alarm_stays_on_its_day(clock, api, schedule, body):
+    with pytest.raises(clock.APIError) as error:
+        api.route("PATCH", "/alarms/day0", body)
+    assert error.value.status == 400
+    assert schedule.alarm("day0")["days"] == [0] and "date" not in schedule.alarm("day0")
+    assert api.route("PATCH", "/alarms/day0", {"days": [0], "hour": 7})[1]["hour"] == 7
+
+
+def test_alarms_are_not_converted_between_recurring_and_one_off(clock, api, schedule):
+    gym = schedule.add(6, 0, days=[1, 3])
+    with pytest.raises(clock.APIError):
+        api.route("PATCH", f"/alarms/{gym}", {"date": "2026-11-02"})
+    flight = schedule.add(4, 15, on=date(2026, 11, 2))
+    with pytest.raises(clock.APIError):
+        api.route("PATCH", f"/alarms/{flight}", {"days": [0]})
+
+
+def test_unknown_alarm_and_resources(clock, api):
+    for method, path in (("GET", "/alarms/nope"), ("GET", "/nothing")):
+        with pytest.raises(clock.APIError) as error:
+            api.route(method, path, None)
+        assert error.value.status == 404
+    with pytest.raises(clock.APIError) as error:
+        api.route("DELETE", "/alarms/day3", None)
+    assert error.value.status == 400
+
+
+def test_own_volume_changes_reach_set_listeners(clock):
+    mixer = clock.VolumeMixer(simulator.SimMixer)
+    assert mixer.ready.wait(5)
+    changes = []
+    mixer.set_listeners.append(changes.append)
+    mixer.set_volume(35)
+    assert changes == [35] and mixer.volume == 35
+
+
+def test_requests_see_hand_edits(api, schedule):
+    schedule.update(6, hour=6)
+    schedule.flush()
+    with open(schedule.path) as schedule_file:
+        data = json.load(schedule_file)
+    data["alarms"].append({"id": "trip", "date": "2026-11-02", "hour": 5, "minute": 0})
+    with open(schedule.path, "w") as schedule_file:
+        json.dump(data, schedule_file)
+    os.utime(schedule.path, (schedule.mtime + 2, schedule.mtime + 2))
+    status, alarms = api.route("GET", "/alarms", None)
+    assert "trip" in [alarm["id"] for alarm in alarms["alarms"]]
+
+
+def test_only_the_seven_weekday_ids_are_special(clock, api, schedule):
+    daylight = schedule.add(7, 0, days=[5, 6], id="daylight")
+    assert api.route("PATCH", f"/alarms/{daylight}", {"days": [6]})[1]["days"] == [6]
+    assert api.route("DELETE", f"/alarms/{daylight}", None) == (200, {"deleted": "daylight"})
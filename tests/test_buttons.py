@@ -0,0 +1,138 @@
+import heapq
+import itertools
+
+import pytest
+
+PIN = 5
+
+
+class FakeLoop:
+    """Just enough of an event loop to run ButtonInput on a virtual clock."""
+
+    def __init__(self):
+        self.now = 0.0
+        self.timers = []
+        self.order = itertools.count()
+
+    def call_soon_threadsafe(self, callback, *args):
+        callback(*args)
+
+    def call_later(self, delay, callback, *args):
+        timer = [self.now + delay, next(self.order), callback, args, False]
+        heapq.heappush(self.timers, timer)
+        return Handle(timer)
+
+    def run_until(self, when):
+        while self.timers and self.timers[0][0] <= when:
+            self.now, _, callback, args, cancelled = heapq.heappop(self.timers)
+            if not cancelled:
+                callback(*args)
+        self.now = when
+
+
+class Handle:
+    def __init__(self, timer):
+        self.timer = timer
+
+    def cancel(self):
+        self.timer[4] = True
+
+
+class Rig:
+    def __init__(self, clock, mode):
+        self.loop = FakeLoop()
+        self.level = False
+        self.events = []
+        self.input = clock.ButtonInput(self.loop, lambda pin: self.level, lambda pin: mode, self.emit)
+
+    def emit(self, pin, event):
+        self.events.append((round(self.loop.now, 3), event))
+
+    def edge(self, at, level):
+        self.loop.run_until(at)
+        self.level = level
+        self.input.on_edge(PIN)
+
+    def bounce(self, at, level, count=4, gap=0.002):
+        """A contact bounce: `count` alternating edges ending on `level`."""
+        for i in range(count):
+            self.edge(at + i * gap, level if (count - i) % 2 else not level)
+
+
+@pytest.fixture
+def rig(clock):
+    return lambda mode: Rig(clock, mode)
+
+
+def names(events):
+    return [event for _, event in events]
+
+
+def test_bouncing_contact_gives_one_press(clock, rig):
+    r = rig(clock.BUTTON_TAP)
+    r.bounce(1.0, True)
+    r.bounce(1.3, False)
+    r.loop.run_until(2.0)
+    assert names(r.events) == ["press"]
+    assert r.events[0][0] == pytest.approx(1.006 + clock.BUTTON_DEBOUNCE)
+
+
+def test_glitch_shorter_than_debounce_is_ignored(clock, rig):
+    r = rig(clock.BUTTON_TAP)
+    r.edge(1.0, True)
+    r.edge(1.0 + clock.BUTTON_DEBOUNCE / 2, False)
+    r.loop.run_until(2.0)
+    assert r.events == []
+
+
+def test_repeat_accelerates_down_to_the_minimum_and_releases(clock, rig):
+    r = rig(clock.BUTTON_REPEAT)
+    r.edge(1.0, True)
+    r.edge(5.0, False)
+    r.loop.run_until(6.0)
+    assert r.events[0][1] == "press"
+    assert r.events[-1][1] == "release"
+    repeats = [at for at, event in r.events if event == "repeat"]
+    assert repeats[0] == pytest.approx(1.0 + clock.BUTTON_DEBOUNCE + clock.BUTTON_REPEAT_DELAY)
+    gaps = [later - earlier for earlier, later in zip(repeats, repeats[1:])]
+    assert all(later <= earlier + 1e-6 for earlier, later in zip(gaps, gaps[1:]))
+    assert gaps[-1] == pytest.approx(clock.BUTTON_REPEAT_MIN_INTERVAL, abs=1e-3)
+    assert max(repeats) < 5.0 + clock.BUTTON_DEBOUNCE
+
+
+def test_short_press_on_long_button_is_delivered_on_release(clock, rig):
+    r = rig(clock.BUTTON_LONG)
+    r.edge(1.0, True)
+    r.edge(1.0 + clock.BUTTON_LONG_PRESS / 2, False)
+    r.loop.run_until(3.0)
+    assert names(r.events) == ["press"]
+    assert r.events[0][0] == pytest.approx(1.0 + clock.BUTTON_LONG_PRESS / 2 + clock.BUTTON_DEBOUNCE)
+
+
+def test_held_long_button_gives_only_long(clock, rig):
+    r = rig(clock.BUTTON_LONG)
+    r.edge(1.0, True)
+    r.edge(1.0 + clock.BUTTON_LONG_PRESS * 2, False)
+    r.loop.run_until(4.0)
+    assert names(r.events) == ["long"]
+    assert r.events[0][0] == pytest.approx(1.0 + clock.BUTTON_DEBOUNCE + clock.BUTTON_LONG_PRESS)
+
+
+def test_wake_press_only_wakes(clock, rig):
+    r = rig(clock.BUTTON_WAKE)
+    r.bounce(1.0, True)
+    r.loop.run_until(3.0)
+    r.bounce(3.0, False)
+    r.loop.run_until(4.0)
+    assert names(r.events) == ["wake"]
+
+
+def test_release_bounce_does_not_press_again(clock, rig):
+    r = rig(clock.BUTTON_TAP)
+    r.edge(1.0, True)
+    r.loop.run_until(1.5)
+    r.bounce(1.5, False, count=6)
+    r.loop.run_until(2.0)
+    r.edge(2.0, True)
+    r.loop.run_until(2.5)
+    assert names(r.events) == ["press", "press"]
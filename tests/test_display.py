@@ -0,0 +1,115 @@
+import numpy as np
+import pytest
+
+
+class FakePanel:
+    """A display without windowed writes: every frame is sent whole as an image."""
+
+    def __init__(self, fail_on=()):
+        self.calls = 0
+        self.fail_on = set(fail_on)
+        self.frames = []
+
+    def display(self, image):
+        self.calls += 1
+        if self.calls in self.fail_on:
+            raise OSError("SPI transfer failed")
+        self.frames.append(np.asarray(image).copy())
+
+
+@pytest.fixture
+def fast_retry(clock, monkeypatch):
+    monkeypatch.setattr(clock, "DISPLAY_RETRY_DELAY", 0.01)
+
+
+def show(thread, value):
+    thread.back.pixels[:] = value
+    thread.submit()
+    assert thread.wait_idle(5)
+
+
+def test_failed_transfer_is_retried_and_the_thread_survives(clock, fast_retry):
+    panel = FakePanel(fail_on={2})
+    renderer = clock.Renderer(panel, 32, 16)
+    thread = clock.DisplayThread(renderer, 32, 16)
+    show(thread, 0xFFFF)
+    show(thread, 0xF800)
+    assert panel.calls == 3 and len(panel.frames) == 2
+    assert thread.errors.value == 1
+    assert (panel.frames[-1][..., 0] == 248).all() and (panel.frames[-1][..., 1:] == 0).all()
+    show(thread, 0x001F)
+    assert len(panel.frames) == 3
+
+
+@pytest.fixture
+def renderer(clock):
+    """A 64x48 renderer whose last frame is all black."""
+    renderer = clock.Renderer(FakePanel(), 64, 48)
+    renderer.has_last_frame = True
+    return renderer
+
+
+def changed(renderer, *points):
+    pixels = renderer.last_frame.copy()
+    for x, y in points:
+        pixels[y, x] = 0xFFFF
+    return renderer.dirty_rects(pixels)
+
+
+def test_unchanged_frame_has_no_dirty_rects(renderer):
+    assert changed(renderer) == []
+
+
+def test_dirty_rect_bounds_the_changes_in_a_band(renderer):
+    assert changed(renderer, (5, 20)) == [(5, 20, 6, 21)]
+    assert changed(renderer, (5, 20), (30, 24), (12, 22)) == [(5, 20, 31, 25)]
+
+
+def test_damage_across_a_band_boundary_is_one_rect(renderer):
+    column = [(3, y) for y in range(21)]
+    assert changed(renderer, *column, (9, 20)) == [(3, 0, 10, 21)]
+
+
+def test_separate_damage_gets_separate_rects(renderer):
+    assert changed(renderer, (1, 0), (50, 40)) == [(1, 0, 2, 1), (50, 40, 51, 41)]
+    assert changed(renderer, (1, 0), (50, 16)) == [(1, 0, 2, 1), (50, 16, 51, 17)]
+
+
+class WindowedPanel:
+    """A panel taking windowed writes into its own (rotated) pixel buffer."""
+
+    def __init__(self, width, height, rotation):
+        self._rotation = rotation
+        shape = (width, height) if rotation % 180 else (height, width)
+        self.pixels = np.zeros(shape, dtype=">u2")
+        self.window = None
+
+    def set_window(self, x0, y0, x1, y1):
+        self.window = (x0, y0, x1 + 1, y1 + 1)
+
+    def data(self, buffer):
+        x0, y0, x1, y1 = self.window
+        self.pixels[y0:y1, x0:x1] = np.frombuffer(buffer, dtype=">u2").reshape(y1 - y0, x1 - x0)
+
+
+@pytest.mark.parametrize("rotation", [0, 90, 180, 270])
+def test_rotated_rect_matches_the_rotated_image(clock, rotation):
+    renderer = clock.Renderer(WindowedPanel(64, 48, rotation), 64, 48)
+    rect = (5, 7, 20, 12)
+    marked = np.zeros((48, 64), dtype=bool)
+    marked[7:12, 5:20] = True
+    rows, cols = np.nonzero(np.rot90(marked, rotation // 90))
+    assert renderer.rotate_rect(rect) == (cols.min(), rows.min(), cols.max() + 1, rows.max() + 1)
+
+
+@pytest.mark.parametrize("rotation", [0, 90, 180, 270])
+def test_windowed_writes_build_the_rotated_frame(clock, rotation):
+    panel = WindowedPanel(64, 48, rotation)
+    renderer = clock.Renderer(panel, 64, 48)
+    pixels = np.arange(48 * 64, dtype=">u2").reshape(48, 64)
+    renderer.show(pixels)
+    pixels = pixels.copy()
+    pixels[2:4, 60:63] = 1
+    pixels[30:40, 10:12] = 2
+    renderer.show(pixels)
+    assert (panel.pixels == np.rot90(pixels, rotation // 90)).all()
@@ -0,0 +1,177 @@
+import json
+import os
+import random
+import time
+from datetime import date, datetime, timedelta
+
+MONDAY = datetime(2026, 10, 12, 8, 0)
+
+
+def brute_force(store, count, after):
+    """The next `count` (fire time, alarm id) pairs, straight from fire_time()."""
+    found = []
+    day = after.date()
+    for _ in range(400):
+        found += sorted((fire_at, alarm["id"]) for alarm in store.alarms
+                        for fire_at in [store.fire_time(alarm, day)] if fire_at is not None and fire_at > after)
+        if len(found) >= count:
+            break
+        day += timedelta(days=1)
+    return found[:count]
+
+
+def indexed(store, count, after):
+    return [(fire_at, alarm["id"]) for fire_at, alarm in store.upcoming(count, after)]
+
+
+def test_weekday_alarms_are_created_disabled(schedule):
+    assert [alarm["id"] for alarm in schedule.times] == [f"day{day}" for day in range(7)]
+    assert not any(alarm["enabled"] for alarm in schedule.times)
+    assert schedule.upcoming(1, MONDAY) == []
+
+
+def test_upcoming_orders_recurring_and_one_off_alarms(schedule):
+    schedule.update(1, hour=7, minute=30, enabled=1)
+    flight = schedule.add(4, 15, on=date(2026, 10, 13))
+    assert indexed(schedule, 2, MONDAY) == [(datetime(2026, 10, 13, 4, 15), flight),
+                                            (datetime(2026, 10, 13, 7, 30), "day1")]
+
+
+def test_one_off_alarm_honours_its_skips(schedule):
+    day = date(2026, 10, 14)
+    flight = schedule.add(6, 0, on=day)
+    schedule.update_alarm(flight, skip={day})
+    assert schedule.upcoming(1, MONDAY) == []
+    schedule.update_alarm(flight, skip=set(), skip_holidays=True)
+    schedule.holidays.add(day)
+    schedule.index.clear()
+    assert schedule.upcoming(1, MONDAY) == []
+    schedule.update_alarm(flight, skip_holidays=False)
+    assert indexed(schedule, 1, MONDAY) == [(datetime(2026, 10, 14, 6, 0), flight)]
+
+
+def test_skip_dates_silence_every_alarm(schedule):
+    schedule.update(0, hour=7, minute=0, enabled=1)
+    gym = schedule.add(6, 0, days=[0])
+    schedule.skip(date(2026, 10, 19))
+    assert [fire_at.date() for fire_at, _ in schedule.upcoming(2, MONDAY)] == [date(2026, 10, 26)] * 2
+    schedule.skip(date(2026, 10, 19), False)
+    assert indexed(schedule, 2, MONDAY) == [(datetime(2026, 10, 19, 6, 0), gym),
+                                            (datetime(2026, 10, 19, 7, 0), "day0")]
+
+
+def test_saved_schedule_reloads_the_same(clock, schedule):
+    schedule.update(2, hour=6, minute=45, enabled=1)
+    schedule.add(22, 0, days=[0, 4], skip_holidays=True, skip={date(2026, 10, 16)})
+    schedule.add(5, 5, on=date(2026, 11, 2))
+    schedule.skip(date(2026, 10, 14))
+    schedule.flush()
+    assert json.load(open(schedule.path))["version"] == clock.SCHEDULE_VERSION
+    reloaded = clock.ScheduleStore(schedule.path, schedule.legacy_path)
+    assert indexed(reloaded, 20, MONDAY) == indexed(schedule, 20, MONDAY)
+
+
+def test_index_matches_brute_force_over_random_edits(schedule):
+    rng = random.Random(22)
+    now = MONDAY
+    first_day = now.date()
+    holidays = {first_day + timedelta(days=rng.randrange(60)) for _ in range(8)}
+    schedule.holidays |= holidays
+    schedule.index.clear()
+
+    def random_day():
+        return first_day + timedelta(days=rng.randrange(45))
+
+    for _ in range(400):
+        extra = [alarm["id"] for alarm in schedule.alarms if not alarm["id"].startswith("day")]
+        edit = rng.randrange(8)
+        if edit == 0 or not extra:
+            schedule.add(rng.randrange(24), rng.choice((0, 15, 30, 45)),
+                         days=rng.sample(range(7), rng.randint(1, 7)), skip_holidays=rng.random() < 0.3)
+        elif edit == 1:
+            schedule.add(rng.randrange(24), rng.randrange(60), on=random_day(), skip_holidays=rng.random() < 0.3)
+        elif edit == 2:
+            schedule.update(rng.randrange(7), hour=rng.randrange(24), minute=rng.randrange(60),
+                            enabled=rng.randint(0, 1))
+        elif edit == 3:
+            alarm_id = rng.choice(extra)
+            schedule.update_alarm(alarm_id, hour=rng.randrange(24), enabled=int(rng.random() < 0.8))
+        elif edit == 4:
+            alarm_id = rng.choice(extra)
+            schedule.update_alarm(alarm_id, skip=set(schedule.alarm(alarm_id)["skip"]) ^ {random_day()})
+        elif edit == 5:
+            schedule.remove(rng.choice(extra))
+        elif edit == 6:
+            day = random_day()
+            schedule.skip(day, day not in schedule.skip_dates)
+        else:
+            # Let time pass so the index window slides, sometimes across days.
+            now += timedelta(minutes=rng.randrange(3 * 24 * 60))
+        count = rng.randint(1, 12)
+        assert indexed(schedule, count, now) == brute_force(schedule, count, now)
+
+
+def edit_by_hand(store, change):
+    """Rewrite the schedule file the way a text editor would, with a newer mtime."""
+    with open(store.path) as schedule_file:
+        data = json.load(schedule_file)
+    change({alarm["id"]: alarm for alarm in data["alarms"]}, data)
+    with open(store.path, "w") as schedule_file:
+        json.dump(data, schedule_file)
+    os.utime(store.path, (store.mtime + 2, store.mtime + 2))
+
+
+def saved_alarms(store):
+    with open(store.path) as schedule_file:
+        return {alarm["id"]: alarm for alarm in json.load(schedule_file)["alarms"]}
+
+
+def test_edit_after_hand_edit_keeps_both(schedule):
+    schedule.update(6, hour=6)
+    schedule.flush()
+    edit_by_hand(schedule, lambda alarms, data: (alarms["day3"].update(enabled=True), data["alarms"].append(
+        {"id": "trip", "date": "2026-11-02", "hour": 5, "minute": 0})))
+    schedule.update(0, hour=7)
+    schedule.flush()
+    alarms = saved_alarms(schedule)
+    assert alarms["day0"]["hour"] == 7 and alarms["day3"]["enabled"] and "trip" in alarms
+
+
+def test_unsaved_edits_are_replayed_onto_a_hand_edit(schedule):
+    schedule.update(6, hour=6)
+    gym = schedule.add(6, 0, days=[1])
+    schedule.flush()
+    schedule.update(1, hour=9, enabled=1)
+    schedule.update_alarm(gym, hour=8)
+    edit_by_hand(schedule, lambda alarms, data: (alarms["day2"].update(hour=4),
+                                                 data.update(alarms=[a for a in data["alarms"] if a["id"] != gym])))
+    schedule.flush()
+    assert saved_alarms(schedule)["day1"]["hour"] == 6, "a save must not overwrite an unmerged hand edit"
+    assert schedule.reload_if_changed()
+    schedule.flush()
+    alarms = saved_alarms(schedule)
+    assert (alarms["day1"]["hour"], alarms["day2"]["hour"]) == (9, 4) and gym not in alarms
+    assert schedule.unsaved == []
+
+
+def test_failed_save_is_logged_and_retried(clock, schedule, monkeypatch, capsys):
+    monkeypatch.setattr(clock, "SCHEDULE_WRITE_DELAY", 0.05)
+    replace = os.replace
+    failures = []
+
+    def flaky_replace(source, target):
+        if not failures:
+            failures.append(target)
+            raise OSError(28, "No space left on device")
+        replace(source, target)
+
+    monkeypatch.setattr(clock.os, "replace", flaky_replace)
+    schedule.update(4, hour=5, enabled=1)
+    schedule.flush()
+    assert "Cannot save" in capsys.readouterr().out and schedule.dirty
+    # unsaved empties only once the retried write has landed.
+    for _ in range(100):
+        if not schedule.unsaved:
+            break
+        time.sleep(0.02)
+    assert saved_alarms(schedule)["day4"]["hour"] == 5
@@ -0,0 +1,132 @@
+import os
+import threading
+
+import pytest
+
+
+class FakeStream:
+    """Serves `segments` numbered segment-sized chunks, then `tail` bytes, then ends."""
+
+    def __init__(self, segments, size, tail=0, content_type=None):
+        self.data = b"".join(bytes([n]) * size for n in range(segments)) + b"\xff" * tail
+        self.headers = FakeHeaders(content_type) if content_type else None
+
+    def read(self, size):
+        chunk, self.data = self.data[:size], self.data[size:]
+        return chunk
+
+    def close(self):
+        pass
+
+
+class StoppingStream(FakeStream):
+    """Delivers one byte per read and sets `stop_event` after `reads` reads."""
+
+    def __init__(self, stop_event, reads):
+        super().__init__(1, 64)
+        self.stop_event = stop_event
+        self.reads = reads
+
+    def read(self, size):
+        self.reads -= 1
+        if not self.reads:
+            self.stop_event.set()
+        return super().read(1)
+
+
+class FakeHeaders:
+    def __init__(self, content_type):
+        self.content_type = content_type
+
+    def get_content_type(self):
+        return self.content_type
+
+
+@pytest.fixture
+def ring(clock, monkeypatch):
+    """A three-segment ring of 4-byte segments."""
+    monkeypatch.setattr(clock, "STREAM_CACHE_SEGMENTS", 3)
+    monkeypatch.setattr(clock, "STREAM_CACHE_SEGMENT_SIZE", 4)
+
+
+def record(cache, stream):
+    """Run the recorder on `stream` until it ends."""
+    with pytest.raises(OSError, match="stream ended"):
+        cache._write_segments(stream, threading.Event())
+
+
+def contents(cache):
+    segments = []
+    for path in cache.segments():
+        with open(path, "rb") as segment:
+            segments.append((os.path.basename(path), segment.read()[0]))
+    return segments
+
+
+def test_segments_fill_the_free_slots_in_order(clock, ring, tmp_path):
+    cache = clock.StreamCache(str(tmp_path), None)
+    record(cache, FakeStream(2, 4))
+    assert contents(cache) == [("segment-00.mp3", 0), ("segment-01.mp3", 1)]
+    assert cache.stale()
+
+
+def test_full_ring_replaces_the_oldest_segment(clock, ring, tmp_path):
+    cache = clock.StreamCache(str(tmp_path), None)
+    record(cache, FakeStream(5, 4))
+    assert contents(cache) == [("segment-02.mp3", 2), ("segment-00.mp3", 3), ("segment-01.mp3", 4)]
+    assert sorted(os.listdir(tmp_path)) == ["segment-00.mp3", "segment-01.mp3", "segment-02.mp3"]
+    assert not cache.stale()
+
+
+def test_free_slot_is_reused_after_a_restart(clock, ring, tmp_path):
+    (tmp_path / "segment-01.mp3").write_bytes(b"\x07" * 4)
+    cache = clock.StreamCache(str(tmp_path), None)
+    assert cache.next_segment_path(".mp3") == str(tmp_path / "segment-00.mp3")
+    record(cache, FakeStream(2, 4))
+    assert contents(cache) == [("segment-01.mp3", 7), ("segment-00.mp3", 0), ("segment-02.mp3", 1)]
+
+
+def test_new_extension_removes_the_oldest_segment(clock, ring, tmp_path):
+    cache = clock.StreamCache(str(tmp_path), None)
+    record(cache, FakeStream(3, 4))
+    assert cache.next_segment_path(".aac") == str(tmp_path / "segment-00.aac")
+    assert not (tmp_path / "segment-00.mp3").exists()
+    assert [os.path.basename(path) for path in cache.segments()] == ["segment-01.mp3", "segment-02.mp3"]
+
+
+def test_content_type_picks_the_extension(clock, ring, tmp_path):
+    cache = clock.StreamCache(str(tmp_path), None)
+    record(cache, FakeStream(3, 4))
+    record(cache, FakeStream(2, 4, content_type="audio/aacp"))
+    assert contents(cache) == [("segment-02.mp3", 2), ("segment-00.aac", 0), ("segment-01.aac", 1)]
+    assert sorted(os.listdir(tmp_path)) == ["segment-00.aac", "segment-01.aac", "segment-02.mp3"]
+
+
+def test_partial_segment_is_dropped_when_the_stream_ends(clock, ring, tmp_path):
+    cache = clock.StreamCache(str(tmp_path), None)
+    record(cache, FakeStream(1, 4, tail=2))
+    assert sorted(os.listdir(tmp_path)) == ["segment-00.mp3"]
+    assert contents(cache) == [("segment-00.mp3", 0)]
+
+
+def test_partial_segment_is_dropped_when_stopped(clock, ring, tmp_path):
+    stop_event = threading.Event()
+    cache = clock.StreamCache(str(tmp_path), None)
+    cache._write_segments(StoppingStream(stop_event, 6), stop_event)
+    assert contents(cache) == [("segment-00.mp3", 0)]
+    assert sorted(os.listdir(tmp_path)) == ["segment-00.mp3"]
+
+
+def test_stop_before_the_first_segment_leaves_nothing(clock, ring, tmp_path):
+    stop_event = threading.Event()
+    cache = clock.StreamCache(str(tmp_path), None)
+    cache._write_segments(StoppingStream(stop_event, 2), stop_event)
+    assert os.listdir(tmp_path) == [] and cache.segments() == []
+
+
+def test_leftover_part_file_is_removed_at_startup(clock, ring, tmp_path):
+    (tmp_path / "recording-1.part").write_bytes(b"\x00")
+    (tmp_path / "segment-00.mp3").write_bytes(b"\x00" * 4)
+    cache = clock.StreamCache(str(tmp_path), None)
+    assert os.listdir(tmp_path) == ["segment-00.mp3"]
+    assert cache.segments() == [str(tmp_path / "segment-00.mp3")]